@@ -47,6 +47,39 @@ def get_github_auth():
     return (username, token)
 
 
+def get_all_artifacts(artifact_name: str):
+    """Obtient tous les artifacts disponibles (non expirés) ayant un nom donné.
+    Les pages de résultats de l'API GitHub sont parcourues jusqu'à la dernière.
+
+    Params:
+        artifact_name: Nom de l'artifact recherché
+
+    Returns:
+        list: Couples (date, url) des artifacts disponibles, du plus récent au plus ancien
+    """
+    github_repo = conf.web.projet_github
+    url = f"https://api.github.com/repos/{github_repo}/actions/artifacts?name={artifact_name}&per_page=100"
+    results = dict()
+    page = 1
+    while True:
+        artifacts = load_json_from_url(f"{url}&page={page}")
+        page_artifacts = artifacts.get("artifacts", [])
+        for artifact in page_artifacts:
+            if artifact.get("name") != artifact_name or artifact.get("expired") != False:
+                continue
+            artifact_datetime = artifact.get("created_at")
+            artifact_url = artifact.get("archive_download_url")
+            artifact_datetime = datetime.strptime(
+                artifact_datetime, "%Y-%m-%dT%H:%M:%SZ"
+            )
+            results[artifact_datetime] = artifact_url
+        if len(page_artifacts) == 0 or page * 100 >= artifacts.get("total_count", 0):
+            break
+        page += 1
+    logging.debug(f"{len(results)} artifacts ayant pour nom {artifact_name}")
+    return sorted(results.items(), reverse=True)
+
+
 def get_last_artifact(artifact_name: str):
     """Obtient le dernier artifact disponible.
 
@@ -56,21 +89,6 @@ def get_last_artifact(artifact_name: str):
     Returns:
         dict: Dernier artifact disponible (date:url)
     """
-    artifacts = get_artifacts()
-    num_artifacts = artifacts.get("total_count")
-    logging.debug(f"{num_artifacts} artifacts disponibles sur le projet")
-    artifacts = [
-        a
-        for a in artifacts.get("artifacts")
-        if a.get("name") == artifact_name and a.get("expired") == False
-    ]
-    logging.debug(f"{len(artifacts)} artifacts ayant pour nom {artifact_name}")
-    results = dict()
-    for artifact in artifacts:
-        artifact_datetime = artifact.get("created_at")
-        artifact_url = artifact.get("archive_download_url")
-        artifact_datetime = datetime.strptime(artifact_datetime, "%Y-%m-%dT%H:%M:%SZ")
-        results[artifact_datetime] = artifact_url
-    last_result = sorted(results.items(), reverse=True)[0]
+    last_result = get_all_artifacts(artifact_name)[0]
     logging.debug(f"Dernier artifact disponible : {last_result}")
     return last_result
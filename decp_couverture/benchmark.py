@@ -0,0 +1,261 @@
+""" Ce module mesure sans navigateur le coût de rendu de l'application web (commande benchmark).
+L'application est exécutée avec des contours et un artifact de couverture générés localement :
+aucun accès au réseau ni à GitHub n'est nécessaire.
+"""
+from datetime import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+import zipfile
+
+import pandas
+
+from decp_couverture import artifacts
+from decp_couverture import conf
+from decp_couverture import download
+from decp_couverture import load
+from decp_couverture import stats
+from decp_couverture import web
+
+FIXTURE_ARTIFACT_URL = "https://fixture/artifacts/benchmark/zip"
+
+
+def square(x: float, y: float, size: float):
+    """Construit l'anneau d'un carré dont le coin inférieur gauche est (x, y)."""
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def build_fixtures(path: str):
+    """Génère des contours et un artifact de couverture fictifs, de taille représentative.
+
+    Args:
+        path (str): Dossier dans lequel les fichiers sont générés
+
+    Returns:
+        dict: Chemins des contours (communes, departements, regions) et de l'artifact
+    """
+    random.seed(0)
+    num_regions = conf.benchmark.nombre_regions
+    num_departments = conf.benchmark.nombre_departements_par_region
+    num_cities = conf.benchmark.nombre_communes_par_departement
+    regions, departments, rows = [], [], []
+    arcs, geometries = [], []
+    for r in range(num_regions):
+        region_code = f"{r + 1:02d}"
+        regions.append((region_code, square(r, 40, 1)))
+        for d in range(num_departments):
+            department_code = f"{r + 1:02d}{d}"
+            departments.append((department_code, square(r, 42 + d, 1)))
+            for c in range(num_cities):
+                city_code = f"{department_code}{c:03d}"
+                # Arcs quantifiés (transform) et encodés en différences, comme dans le fichier réel
+                x, y = r * num_cities + c, d * 10
+                arcs.append([[x, y], [1, 0], [0, 1], [-1, 0], [0, -1]])
+                geometries.append(
+                    {
+                        "type": "Polygon",
+                        "arcs": [[len(arcs) - 1]],
+                        "properties": {"ID": city_code},
+                    }
+                )
+                for year in conf.web.annees:
+                    rows.append(
+                        {
+                            "annee_marche": year,
+                            "code_region_acheteur": region_code,
+                            "code_departement_acheteur": department_code,
+                            "code_commune_acheteur": city_code,
+                            "nombre_marches": random.randint(1, 500),
+                            "nombre_sirens_decp": random.randint(0, 10),
+                            "nombre_sirets_decp": random.randint(0, 20),
+                            "nombre_sirens_insee": random.randint(5, 15),
+                            "nombre_sirets_insee": random.randint(10, 30),
+                        }
+                    )
+
+    def feature_collection(zones):
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"code": code, "nom": f"Zone {code}"},
+                    "geometry": {"type": "Polygon", "coordinates": [ring]},
+                }
+                for code, ring in zones
+            ],
+        }
+
+    paths = {
+        "communes": os.path.join(path, "communes.topo.json"),
+        "departements": os.path.join(path, "departements.geo.json"),
+        "regions": os.path.join(path, "regions.geo.json"),
+        "artifact": os.path.join(path, "coverage.zip"),
+    }
+    topology = {
+        "type": "Topology",
+        "transform": {"scale": [0.01, 0.01], "translate": [-5, 41]},
+        "arcs": arcs,
+        "objects": {"poly": {"type": "GeometryCollection", "geometries": geometries}},
+    }
+    for name, data in [
+        ("communes", topology),
+        ("departements", feature_collection(departments)),
+        ("regions", feature_collection(regions)),
+    ]:
+        with open(paths[name], "w", encoding="utf-8") as file_writer:
+            json.dump(data, file_writer)
+    parquet_path = os.path.join(path, "coverage.parquet")
+    load.save_coverage_to_parquet_file(pandas.DataFrame(rows), parquet_path)
+    with zipfile.ZipFile(paths["artifact"], "w") as artifact_zip:
+        artifact_zip.write(parquet_path, "coverage.parquet")
+    return paths
+
+
+def render(selection: dict):
+    """Exécute web.run pour une sélection de l'utilisateur.
+
+    Args:
+        selection (dict): Valeur de chaque widget, par libellé
+
+    Returns:
+        int: Taille du code HTML de la carte envoyé au navigateur, en octets
+    """
+    html_sizes = []
+
+    def select(label, options, index=0, **kwargs):
+        options = list(options)
+        return selection.get(label, options[index])
+
+    def display_html(html, **kwargs):
+        html_sizes.append(len(html.encode("utf-8")))
+
+    with mock.patch.object(web.st.sidebar, "selectbox", select), mock.patch.object(
+        web.components, "html", display_html
+    ):
+        web.run()
+    return sum(html_sizes)
+
+
+def measure(repetitions: int):
+    """Mesure le rendu de chaque échelle de l'application web.
+
+    Args:
+        repetitions (int): Nombre de rendus chronométrés par échelle
+
+    Returns:
+        dict: Durée médiane d'un rendu sans statistiques en cache (ms), mémoire maximale (octets)
+        et taille HTML (octets) par échelle
+    """
+    results = dict()
+    with tempfile.TemporaryDirectory() as fixtures_path:
+        paths = build_fixtures(fixtures_path)
+
+        def download_fixture(url, path, **kwargs):
+            shutil.copyfile(paths["artifact"], path)
+
+        with mock.patch.dict(
+            conf.download.contours.communes, {"chemin": paths["communes"]}
+        ), mock.patch.dict(
+            conf.download.contours.departements, {"chemin": paths["departements"]}
+        ), mock.patch.dict(
+            conf.download.contours.regions, {"chemin": paths["regions"]}
+        ), mock.patch.dict(
+            conf.web, {"utiliser_site_precalcule": False}
+        ), mock.patch.object(
+            web.contours_cache, "func", lambda: None
+        ), mock.patch.object(
+            web.coverage_artifacts_cache,
+            "func",
+            lambda: [(datetime(2021, 1, 1), FIXTURE_ARTIFACT_URL)],
+        ), mock.patch.object(
+            download, "download_data_from_url_to_file", download_fixture
+        ), mock.patch.object(
+            artifacts, "get_github_auth", lambda: None
+        ):
+            for scale, zone_column in stats.SCALES.items():
+                # L'année et l'indicateur sont sélectionnés dans le navigateur : une carte par échelle
+                selection = {"Echelle": scale}
+                # Premier rendu : remplit les caches et mesure la mémoire maximale
+                tracemalloc.start()
+                html_size = render(selection)
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                durations = []
+                for _ in range(repetitions):
+                    # Les statistiques et la carte sont recalculées à chaque rendu chronométré,
+                    # seuls les contours restent chargés (comme après le préchauffage du serveur)
+                    web.snapshot_cache.clear()
+                    started_at = time.perf_counter()
+                    render(selection)
+                    durations.append((time.perf_counter() - started_at) * 1000)
+                durations.sort()
+                results[zone_column] = {
+                    "duree_ms": round(durations[len(durations) // 2], 1),
+                    "memoire_max_octets": peak_memory,
+                    "taille_html_octets": html_size,
+                }
+                print(f"{zone_column} : {results[zone_column]}")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, duration_margin: float):
+    """Compare des mesures à une référence.
+
+    Args:
+        results (dict): Mesures par échelle
+        baseline (dict): Mesures de référence par échelle
+        tolerance (float): Augmentation relative tolérée (0.2 pour 20%)
+        duration_margin (float): Augmentation des durées tolérée en plus, en ms (bruit de mesure)
+
+    Returns:
+        list: Régressions constatées (échelle, mesure, référence, valeur)
+    """
+    regressions = []
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(key, {}).get(metric)
+            if reference is None:
+                continue
+            allowed = reference * (1 + tolerance)
+            if metric == "duree_ms":
+                allowed += duration_margin
+            if value > allowed:
+                regressions.append((key, metric, reference, value))
+    return regressions
+
+
+def run(repetitions: int = None, update_baseline: bool = False):
+    """Mesure le rendu de l'application web et le compare à la référence enregistrée.
+    Le processus se termine en erreur si une régression est constatée.
+
+    Args:
+        repetitions (int, optional): Nombre de rendus chronométrés par échelle. Defaults to None.
+        update_baseline (bool, optional): Si les mesures remplacent la référence. Defaults to False.
+    """
+    if repetitions is None:
+        repetitions = conf.benchmark.repetitions
+    results = measure(repetitions)
+    path = conf.benchmark.chemin_reference
+    if update_baseline or not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as file_writer:
+            json.dump(results, file_writer, ensure_ascii=False, indent=2)
+        print(f"Référence enregistrée : {path}")
+        return
+    regressions = compare(
+        results,
+        load.open_json(path),
+        conf.benchmark.tolerance,
+        conf.benchmark.marge_duree_ms,
+    )
+    for key, metric, reference, value in regressions:
+        print(f"Régression {key} {metric} : {reference} -> {value}")
+    if len(regressions) > 0:
+        sys.exit(1)
+    print(f"Aucune régression par rapport à la référence {path}")
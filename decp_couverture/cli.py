@@ -7,8 +7,11 @@ import sys
 import streamlit.cli
 
 from decp_couverture import web
+from decp_couverture import benchmark
 from decp_couverture import coverage
 from decp_couverture import download
+from decp_couverture import prerender
+from decp_couverture import service
 
 
 def command_download(args=None):
@@ -26,12 +29,28 @@ def command_coverage(args=None):
     coverage.run(args.rows)
 
 
+def command_build_site(args=None):
+    """Pré-calcule les cartes et tableaux de l'application web"""
+    prerender.run()
+
+
 def command_web(args=None):
     """Lance l'application web de présentation de la couverture"""
+    web.start_warmup()
     sys.argv = ["0", "run", "./streamlit_app.py"]
     streamlit.cli.main()
 
 
+def command_benchmark(args=None):
+    """Mesure le rendu de l'application web et le compare à la référence"""
+    benchmark.run(repetitions=args.repetitions, update_baseline=args.update_baseline)
+
+
+def command_serve(args=None):
+    """Lance le service local d'interrogation des statistiques de couverture"""
+    service.run(host=args.host, port=args.port)
+
+
 def get_parser():
     """
     Creates a new argument parser.
@@ -76,6 +95,42 @@ def get_parser():
         help="nombre de lignes de DECP et base Sirene à utiliser",
         type=int,
     )
+    build_site_command = subparser.add_parser(
+        "build-site",
+        help="pré-calcule les cartes et tableaux de l'application web à partir des statistiques de couverture",
+    )
+    benchmark_command = subparser.add_parser(
+        "benchmark",
+        help="mesure sans navigateur ni réseau le rendu de l'application web et le compare à la référence",
+    )
+    benchmark_command.add_argument(
+        "--repetitions",
+        required=False,
+        help="nombre de rendus chronométrés par échelle",
+        type=int,
+    )
+    benchmark_command.add_argument(
+        "--update-baseline",
+        required=False,
+        help="enregistrer les mesures comme nouvelle référence",
+        action="store_true",
+    )
+    serve_command = subparser.add_parser(
+        "serve",
+        help="lancer le service local d'interrogation des statistiques de couverture (par SIREN, commune, département, région)",
+    )
+    serve_command.add_argument(
+        "--host",
+        required=False,
+        help="adresse d'écoute du service",
+        type=str,
+    )
+    serve_command.add_argument(
+        "--port",
+        required=False,
+        help="port d'écoute du service",
+        type=int,
+    )
     web_command = subparser.add_parser(
         "web", help="lancer l'application web de présentation de la couverture"
     )
@@ -94,5 +149,11 @@ def run(args=None):
         command_download(args)
     elif args.command == "coverage":
         command_coverage(args)
+    elif args.command == "build-site":
+        command_build_site(args)
+    elif args.command == "benchmark":
+        command_benchmark(args)
+    elif args.command == "serve":
+        command_serve(args)
     elif args.command == "web":
         command_web(args)
@@ -0,0 +1,68 @@
+""" Ce module extrait des contours (geojson ou topojson) les zones d'une sélection,
+pour n'afficher que les enfants d'une région ou d'un département.
+"""
+
+
+def filter_geojson(geo_data: dict, property_name: str, codes: list):
+    """Conserve les entités geojson dont le code fait partie de la sélection.
+
+    Args:
+        geo_data (dict): Données géographiques (format geojson)
+        property_name (str): Propriété contenant le code de la zone
+        codes (list): Codes des zones à conserver
+
+    Returns:
+        dict: Données géographiques réduites (format geojson)
+    """
+    codes = set(codes)
+    features = [
+        feature
+        for feature in geo_data["features"]
+        if feature.get("properties", {}).get(property_name) in codes
+    ]
+    return {**geo_data, "features": features}
+
+
+def filter_topojson(topo_data: dict, object_name: str, property_name: str, codes: list):
+    """Conserve les géométries topojson dont le code fait partie de la sélection.
+    Seuls les arcs utilisés par ces géométries sont conservés, puis renumérotés.
+
+    Args:
+        topo_data (dict): Données géographiques (format topojson)
+        object_name (str): Nom de l'objet topojson contenant les géométries
+        property_name (str): Propriété contenant le code de la zone
+        codes (list): Codes des zones à conserver
+
+    Returns:
+        dict: Données géographiques réduites (format topojson)
+    """
+    codes = set(codes)
+    topo_object = topo_data["objects"][object_name]
+    arcs_mapping = dict()
+
+    def remap_arc(index):
+        # Un indice négatif ~i désigne l'arc i parcouru en sens inverse
+        original_index = index if index >= 0 else ~index
+        new_index = arcs_mapping.setdefault(original_index, len(arcs_mapping))
+        return new_index if index >= 0 else ~new_index
+
+    def remap_arcs(arcs):
+        if len(arcs) > 0 and isinstance(arcs[0], int):
+            return [remap_arc(index) for index in arcs]
+        return [remap_arcs(sub_arcs) for sub_arcs in arcs]
+
+    geometries = []
+    for geometry in topo_object["geometries"]:
+        if geometry.get("properties", {}).get(property_name) not in codes:
+            continue
+        if "arcs" in geometry:
+            geometry = {**geometry, "arcs": remap_arcs(geometry["arcs"])}
+        geometries.append(geometry)
+    arcs = [None] * len(arcs_mapping)
+    for original_index, new_index in arcs_mapping.items():
+        arcs[new_index] = topo_data["arcs"][original_index]
+    return {
+        **topo_data,
+        "arcs": arcs,
+        "objects": {object_name: {**topo_object, "geometries": geometries}},
+    }
@@ -1,3 +1,6 @@
+import numpy
+import pandas
+
 from decp_couverture import load
 from decp_couverture import conf
 
@@ -10,6 +13,91 @@ def filter_public_sirens(dataframe, column_siren):
     return dataframe
 
 
+def sirets_to_int(sirets: pandas.Series):
+    """Convertit des SIRETs (texte) en entiers. Les SIRETs non numériques valent -1.
+
+    Args:
+        sirets (pandas.Series): SIRETs au format texte
+
+    Returns:
+        numpy.ndarray: SIRETs au format entier (int64)
+    """
+    return (
+        pandas.to_numeric(sirets, errors="coerce").fillna(-1).astype("int64").to_numpy()
+    )
+
+
+def build_sirets_index(sirets: pandas.Series):
+    """Construit un index des SIRETs sous forme de tableau trié d'entiers.
+    Le tableau est construit une seule fois et interrogé par dichotomie.
+
+    Args:
+        sirets (pandas.Series): SIRETs au format texte
+
+    Returns:
+        numpy.ndarray: SIRETs uniques et triés (int64)
+    """
+    sirets_index = numpy.unique(sirets_to_int(sirets))
+    return sirets_index[sirets_index >= 0]
+
+
+def match_sirets(sirets_index: numpy.ndarray, sirets: pandas.Series):
+    """Indique pour chaque SIRET s'il est présent dans l'index.
+
+    Args:
+        sirets_index (numpy.ndarray): Index construit par build_sirets_index
+        sirets (pandas.Series): SIRETs à rechercher au format texte
+
+    Returns:
+        numpy.ndarray: Masque booléen (True si le SIRET est présent dans l'index)
+    """
+    values = sirets_to_int(sirets)
+    if len(sirets_index) == 0:
+        return numpy.zeros(len(values), dtype=bool)
+    positions = numpy.searchsorted(sirets_index, values)
+    positions = positions.clip(max=len(sirets_index) - 1)
+    return sirets_index[positions] == values
+
+
+def load_public_sirens(rows: int = None):
+    """Charge les établissements publics (SIREN 1* ou 2*) de la base Sirene.
+    La base est lue par blocs pour que la mémoire utilisée ne dépende que du nombre
+    d'établissements publics, et non de la taille du stock complet.
+
+    Args:
+        rows (int, optional): Nombre de lignes de la base Sirene à utiliser. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: SIREN, SIRET et code commune des établissements publics
+    """
+    sirens_columns = [
+        conf.coverage.noms_colonnes_sirens.siren_acheteur,
+        conf.coverage.noms_colonnes_sirens.siret_acheteur,
+        conf.coverage.noms_colonnes_sirens.code_commune_acheteur,
+    ]
+    sirens_chunks = load.load_sirens(
+        columns=sirens_columns, rows=rows, chunksize=conf.coverage.taille_blocs_sirens
+    )
+    num_tous_sirens = 0
+    public_sirens = []
+    for sirens in sirens_chunks:
+        sirens = sirens[sirens_columns].rename(
+            columns={
+                conf.coverage.noms_colonnes_sirens.siren_acheteur: "siren_acheteur",
+                conf.coverage.noms_colonnes_sirens.siret_acheteur: "siret_acheteur",
+                conf.coverage.noms_colonnes_sirens.code_commune_acheteur: "code_commune_acheteur",
+            }
+        )
+        num_tous_sirens += len(sirens)
+        public_sirens.append(filter_public_sirens(sirens, "siren_acheteur"))
+    sirens = pandas.concat(public_sirens, ignore_index=True)
+    num_sirens_publiques = len(sirens)
+    print(
+        f"Nombre de SIRENs réduit de {num_tous_sirens} à {num_sirens_publiques} en conservant les SIREN publiques (1* ou 2*)"
+    )
+    return sirens
+
+
 def run(rows: int = None):
     """Calcule des statistiques de couverture par commune, département, région.
     Sauvegarde les résultats sur le disque.
@@ -21,6 +109,7 @@ def run(rows: int = None):
         conf.coverage.noms_colonnes_decp.code_region_acheteur,
         conf.coverage.noms_colonnes_decp.annee_marche,
         conf.coverage.noms_colonnes_decp.siren_acheteur,
+        conf.coverage.noms_colonnes_decp.siret_acheteur,
         "sirenAcheteurValide",
     ]
     decp = load.load_decp(columns=decp_columns, rows=rows)
@@ -32,6 +121,7 @@ def run(rows: int = None):
             conf.coverage.noms_colonnes_decp.code_region_acheteur: "code_region_acheteur",
             conf.coverage.noms_colonnes_decp.annee_marche: "annee_marche",
             conf.coverage.noms_colonnes_decp.siren_acheteur: "siren_acheteur",
+            conf.coverage.noms_colonnes_decp.siret_acheteur: "siret_acheteur",
         }
     )
     num_marches_tous_siren = len(decp)
@@ -48,6 +138,17 @@ def run(rows: int = None):
         f"Nombre de marchés réduit de {num_marches_siren_valide} à {num_marches_siren_publiques} en conservant les SIREN publiques (1* ou 2*)"
     )
 
+    sirens = load_public_sirens(rows=rows)
+
+    # Les SIRETs acheteurs des DECP sont rapprochés des établissements publics de la base Sirene
+    sirets_index = build_sirets_index(sirens.siret_acheteur)
+    decp["siret_acheteur_sirene"] = decp.siret_acheteur.where(
+        match_sirets(sirets_index, decp.siret_acheteur)
+    )
+    print(
+        f"{decp.siret_acheteur_sirene.nunique()} SIRETs acheteurs des DECP sur {decp.siret_acheteur.nunique()} trouvés parmi les {len(sirets_index)} établissements publics de la base Sirene"
+    )
+
     coverage_stats = decp.groupby(
         [
             "annee_marche",
@@ -58,36 +159,45 @@ def run(rows: int = None):
     ).agg(
         nombre_marches=("id_marche", "nunique"),
         nombre_sirens_decp=("siren_acheteur", "nunique"),
+        nombre_sirets_decp=("siret_acheteur_sirene", "nunique"),
     )
     coverage_stats = coverage_stats.reset_index()
 
-    sirens_columns = [
-        conf.coverage.noms_colonnes_sirens.siren_acheteur,
-        conf.coverage.noms_colonnes_sirens.siret_acheteur,
-        conf.coverage.noms_colonnes_sirens.code_commune_acheteur,
-    ]
-    sirens = load.load_sirens(columns=sirens_columns, rows=rows)
-    sirens = sirens.rename(
-        columns={
-            conf.coverage.noms_colonnes_sirens.siren_acheteur: "siren_acheteur",
-            conf.coverage.noms_colonnes_sirens.siret_acheteur: "siret_acheteur",
-            conf.coverage.noms_colonnes_sirens.code_commune_acheteur: "code_commune_acheteur",
-        }
-    )
-    num_tous_sirens = len(sirens)
-    sirens = filter_public_sirens(sirens, "siren_acheteur")
-    num_sirens_publiques = len(sirens)
-    print(
-        f"Nombre de SIRENs réduit de {num_tous_sirens} à {num_sirens_publiques} en conservant les SIREN publiques (1* ou 2*)"
-    )
-
     sirens_stats = sirens.groupby(["code_commune_acheteur",]).agg(
         nombre_sirens_insee=("siren_acheteur", "nunique"),
-        # nombre_sirets_insee=('siret_acheteur', 'nunique')
+        nombre_sirets_insee=("siret_acheteur", "nunique"),
     )
     coverage_stats = coverage_stats.merge(
         sirens_stats, how="left", left_on="code_commune_acheteur", right_index=True
     )
+    # Statistiques par SIREN, interrogées par le service de requêtes (commande serve)
+    sirens_coverage = (
+        decp.groupby(["annee_marche", "siren_acheteur"])
+        .agg(
+            code_region_acheteur=("code_region_acheteur", "first"),
+            code_departement_acheteur=("code_departement_acheteur", "first"),
+            code_commune_acheteur=("code_commune_acheteur", "first"),
+            nombre_marches=("id_marche", "nunique"),
+            nombre_sirets_decp=("siret_acheteur_sirene", "nunique"),
+        )
+        .reset_index()
+    )
+    sirens_reference = (
+        sirens.groupby("siren_acheteur")
+        .agg(
+            code_commune_acheteur=("code_commune_acheteur", "first"),
+            nombre_sirets_insee=("siret_acheteur", "nunique"),
+        )
+        .reset_index()
+    )
+    load.save_data_to_csv_file(
+        sirens_coverage, conf.coverage.chemin_sirens, index=False
+    )
+    load.save_data_to_csv_file(
+        sirens_reference, conf.coverage.chemin_reference_sirens, index=False
+    )
+
     path = conf.coverage.chemin
     print(coverage_stats.dtypes)
     load.save_data_to_csv_file(coverage_stats, path, index=False, float_format="%.2f")
+    load.save_coverage_to_parquet_file(coverage_stats, conf.coverage.chemin_parquet)
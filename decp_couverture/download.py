@@ -45,12 +45,15 @@ def download_data_from_url_to_file(
         auth=auth,
         headers=headers,
     )
-    with open(path, "wb") as file_writer:
+    # Le fichier est écrit à part puis renommé, pour ne jamais être lu incomplet
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file_writer:
         if stream:
             for chunk in response.iter_content(chunk_size=4096):
                 file_writer.write(chunk)
         else:
             file_writer.write(response.content)
+    os.replace(temporary_path, path)
 
 
 def save_json(data: dict, path: str):
@@ -0,0 +1,148 @@
+""" Ce module mesure les performances de l'application web : durée de chaque étape d'un rendu,
+succès et échecs des caches, taille des données transmises.
+L'instrumentation est désactivée par défaut (option web.instrumentation du fichier de configuration,
+ou variable d'environnement INSTRUMENTATION=1).
+"""
+from collections import defaultdict
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+from decp_couverture import conf
+
+ENABLED = conf.web.instrumentation or os.environ.get("INSTRUMENTATION") == "1"
+
+# Compteurs d'appels et d'échecs des caches, partagés par toutes les sessions du serveur
+_cache_counters = defaultdict(lambda: {"appels": 0, "echecs": 0})
+_cache_counters_lock = threading.Lock()
+
+
+class _RunMeasures(threading.local):
+    """Mesures du rendu en cours. Chaque rendu Streamlit s'exécute dans son propre thread."""
+
+    def __init__(self):
+        super().__init__()
+        self.started_at = None
+        self.timings = None
+        self.payloads = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.timings = dict()
+        self.payloads = dict()
+
+    def add_timing(self, name: str, duration: float):
+        if self.timings is not None:
+            self.timings[name] = self.timings.get(name, 0) + duration
+
+    def add_payload(self, name: str, size: int):
+        if self.payloads is not None:
+            self.payloads[name] = size
+
+
+_current_run = _RunMeasures()
+
+
+def start_run():
+    """Démarre les mesures d'un nouveau rendu de la page."""
+    _current_run.start()
+
+
+@contextlib.contextmanager
+def step(name: str):
+    """Mesure la durée d'une étape du rendu en cours.
+
+    Args:
+        name (str): Nom de l'étape
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        if ENABLED:
+            _current_run.add_timing(name, (time.perf_counter() - started_at) * 1000)
+
+
+def record_payload(name: str, size: int):
+    """Enregistre la taille d'une donnée chargée ou transmise lors du rendu en cours.
+
+    Args:
+        name (str): Nom de la donnée
+        size (int): Taille en octets
+    """
+    if ENABLED:
+        _current_run.add_payload(name, size)
+
+
+def count_cache(name: str, counter: str):
+    """Incrémente un compteur d'un cache.
+
+    Args:
+        name (str): Nom du cache
+        counter (str): Compteur à incrémenter (appels ou echecs)
+    """
+    with _cache_counters_lock:
+        _cache_counters[name][counter] += 1
+
+
+def get_cache_counters():
+    """Obtient les compteurs de chaque cache depuis le démarrage du serveur.
+
+    Returns:
+        dict: Nombre d'appels, de succès et d'échecs par cache
+    """
+    with _cache_counters_lock:
+        return {
+            name: {
+                "appels": counters["appels"],
+                "succes": counters["appels"] - counters["echecs"],
+                "echecs": counters["echecs"],
+            }
+            for name, counters in _cache_counters.items()
+        }
+
+
+def end_run():
+    """Termine les mesures du rendu en cours et les exporte dans les logs au format JSON.
+
+    Returns:
+        dict: Mesures du rendu (durées en ms, tailles en octets, compteurs des caches)
+    """
+    report = {
+        "evenement": "rendu_web",
+        "duree_totale_ms": round((time.perf_counter() - _current_run.started_at) * 1000, 1),
+        "durees_ms": {
+            name: round(duration, 1) for name, duration in _current_run.timings.items()
+        },
+        "tailles_octets": dict(_current_run.payloads),
+        "caches": get_cache_counters(),
+    }
+    logging.info(json.dumps(report, ensure_ascii=False))
+    return report
+
+
+def display_report(report: dict):
+    """Affiche les mesures d'un rendu dans un panneau de la barre latérale.
+
+    Args:
+        report (dict): Mesures retournées par end_run
+    """
+    with st.sidebar.expander("Performances du rendu"):
+        st.markdown(f"**Durée totale :** {report['duree_totale_ms']} ms")
+        markdown = "| Etape | Durée (ms) | \n | ------------- |:-------------:|"
+        for name, duration in report["durees_ms"].items():
+            markdown += f"\n | {name} | {duration} |"
+        st.markdown(markdown)
+        markdown = "| Donnée | Taille (octets) | \n | ------------- |:-------------:|"
+        for name, size in report["tailles_octets"].items():
+            markdown += f"\n | {name} | {size} |"
+        st.markdown(markdown)
+        markdown = "| Cache | Succès | Echecs | \n | ------------- |:-------------:|:-------------:|"
+        for name, counters in report["caches"].items():
+            markdown += f"\n | {name} | {counters['succes']} | {counters['echecs']} |"
+        st.markdown(markdown)
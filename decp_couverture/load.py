@@ -1,6 +1,13 @@
+import gzip
 import json
+import os
+import pickle
+import shutil
+import tempfile
 
 import pandas
+import pyarrow
+import pyarrow.parquet
 
 from decp_couverture import conf
 
@@ -14,6 +21,7 @@ def load_data_from_csv_file(
     columns: list = None,
     index_col: str = None,
     dtype: dict = None,
+    chunksize: int = None,
 ):
     """Charge de la donnée depuis un fichier du disque.
 
@@ -24,9 +32,10 @@ def load_data_from_csv_file(
         columns (list, optional): Colonnes à charger. Defaults to None.
         index_col (str, optional): Numéro de la colonne d'index. Defaults to None.
         dtype (dict, optional): Types des colonnes. Defaults to None.
+        chunksize (int, optional): Nombre de lignes par bloc, pour un chargement itératif. Defaults to None.
 
     Returns:
-        pandas.DataFrame: Données chargées
+        pandas.DataFrame: Données chargées (itérateur de blocs si chunksize est renseigné)
     """
     return pandas.read_csv(
         path,
@@ -36,6 +45,7 @@ def load_data_from_csv_file(
         index_col=index_col,
         usecols=columns,
         dtype=dtype,
+        chunksize=chunksize,
     )
 
 
@@ -58,8 +68,66 @@ def open_json(path: str):
     Returns:
         dict: Données du fichier
     """
-    with open(path, "rb") as file_reader:
-        return json.loads(file_reader.read().decode("utf-8"))
+    with open(path, "r", encoding="utf-8") as file_reader:
+        return json.load(file_reader)
+
+
+def open_json_with_cache(path: str):
+    """Charge un fichier JSON en passant par un cache binaire (pickle) stocké à côté du fichier.
+    Le cache est invalidé dès que la date de modification du fichier source change.
+
+    Args:
+        path (str): Chemin vers un fichier JSON (utf8)
+
+    Returns:
+        dict: Données du fichier
+    """
+    cache_path = f"{path}.pickle"
+    source_mtime = os.path.getmtime(path)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as file_reader:
+                # La date de modification est lue seule pour ne pas désérialiser un cache périmé
+                if pickle.load(file_reader) == source_mtime:
+                    return pickle.load(file_reader)
+        except (EOFError, pickle.UnpicklingError):
+            # Cache tronqué ou corrompu : il est reconstruit à partir du fichier source
+            pass
+    data = open_json(path)
+    # Fichier temporaire propre à chaque écriture : plusieurs threads peuvent reconstruire le cache en même temps
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(cache_path) or "."
+    )
+    with os.fdopen(file_descriptor, "wb") as file_writer:
+        pickle.dump(source_mtime, file_writer, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, file_writer, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, cache_path)
+    return data
+
+
+def save_gzip(content: str, path: str):
+    """Stocke un texte compressé (gzip) sur le disque.
+
+    Args:
+        content (str): Texte à stocker
+        path (str): Chemin vers le fichier (utf8)
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as file_writer:
+        file_writer.write(content)
+
+
+def open_gzip(path: str):
+    """Charge un texte compressé (gzip) depuis le disque.
+
+    Args:
+        path (str): Chemin vers le fichier (utf8)
+
+    Returns:
+        str: Texte du fichier
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file_reader:
+        return file_reader.read()
 
 
 def load_decp(rows: int = None, columns: list = None):
@@ -77,6 +145,8 @@ def load_decp(rows: int = None, columns: list = None):
         dtype={
             "codeRegionAcheteur": str,
             "codeDepartementAcheteur": str,
+            "departementAcheteur": str,
+            "codeCommuneAcheteur": str,
             "anneeNotification": "Int32",
             "sirenAcheteur": str,
             "siretAcheteur": str,
@@ -86,7 +156,7 @@ def load_decp(rows: int = None, columns: list = None):
     )
 
 
-def load_sirens(rows: int = None, columns: list = None):
+def load_sirens(rows: int = None, columns: list = None, chunksize: int = None):
     path = conf.download.sirens.chemin
     sep = conf.download.sirens.separateur_csv
     index_col = "siret"
@@ -98,6 +168,7 @@ def load_sirens(rows: int = None, columns: list = None):
         rows=rows,
         # index_col=index_col,
         columns=columns,
+        chunksize=chunksize,
         dtype={
             "siren": str,
             "siret": str,
@@ -107,16 +178,198 @@ def load_sirens(rows: int = None, columns: list = None):
     )
 
 
+def load_coverage(path: str):
+    """Charge les statistiques de couverture depuis un fichier CSV (éventuellement zippé).
+
+    Args:
+        path (str): Chemin du fichier
+
+    Returns:
+        pandas.DataFrame: Statistiques de couverture par région, département, commune, année.
+    """
+    coverage = load_data_from_csv_file(
+        path,
+        sep=conf.coverage.separateur_csv,
+        dtype={
+            "code_region_acheteur": str,
+            "code_departement_acheteur": str,
+            "code_commune_acheteur": str,
+            "annee_marche": int,
+            "nombre_marches": int,
+            "nombre_sirens_decp": "Int64",
+            "nombre_sirens_insee": "Int64",
+            "nombre_sirets_decp": "Int64",
+            "nombre_sirets_insee": "Int64",
+        },
+    )
+    # Les artifacts produits avant le décompte des SIRETs n'ont pas ces colonnes
+    for column in ["nombre_sirets_decp", "nombre_sirets_insee"]:
+        if column not in coverage.columns:
+            coverage[column] = pandas.Series(pandas.NA, index=coverage.index, dtype="Int64")
+    return coverage
+
+
+def load_sirens_coverage(path: str):
+    """Charge le nombre de marchés par SIREN acheteur et par année.
+
+    Args:
+        path (str): Chemin du fichier
+
+    Returns:
+        pandas.DataFrame: Marchés et SIRETs des DECP par année et SIREN acheteur
+    """
+    return load_data_from_csv_file(
+        path,
+        sep=conf.coverage.separateur_csv,
+        dtype={
+            "annee_marche": int,
+            "siren_acheteur": str,
+            "code_region_acheteur": str,
+            "code_departement_acheteur": str,
+            "code_commune_acheteur": str,
+            "nombre_marches": int,
+            "nombre_sirets_decp": int,
+        },
+    )
+
+
+def load_sirens_reference(path: str):
+    """Charge le référentiel des SIRENs publics de la base Sirene.
+
+    Args:
+        path (str): Chemin du fichier
+
+    Returns:
+        pandas.DataFrame: Commune et nombre d'établissements de chaque SIREN public
+    """
+    return load_data_from_csv_file(
+        path,
+        sep=conf.coverage.separateur_csv,
+        dtype={
+            "siren_acheteur": str,
+            "code_commune_acheteur": str,
+            "nombre_sirets_insee": int,
+        },
+    )
+
+
+# Schéma du fichier parquet des statistiques de couverture
+COVERAGE_SCHEMA = pyarrow.schema(
+    [
+        ("annee_marche", pyarrow.int16()),
+        ("code_region_acheteur", pyarrow.string()),
+        ("code_departement_acheteur", pyarrow.string()),
+        ("code_commune_acheteur", pyarrow.string()),
+        ("nombre_marches", pyarrow.int32()),
+        ("nombre_sirens_decp", pyarrow.int32()),
+        ("nombre_sirets_decp", pyarrow.int32()),
+        ("nombre_sirens_insee", pyarrow.int32()),
+        ("nombre_sirets_insee", pyarrow.int32()),
+    ]
+)
+
+
+def save_coverage_to_parquet_file(coverage: pandas.DataFrame, path: str):
+    """Stocke les statistiques de couverture dans un fichier parquet compressé, trié par année.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture
+        path (str): Chemin du fichier
+    """
+    table = pyarrow.Table.from_pandas(
+        coverage.sort_values("annee_marche")[COVERAGE_SCHEMA.names],
+        schema=COVERAGE_SCHEMA,
+        preserve_index=False,
+    )
+    pyarrow.parquet.write_table(table, path, compression="zstd")
+
+
+def load_coverage_from_parquet_file(path: str):
+    """Charge les statistiques de couverture depuis un fichier parquet.
+
+    Args:
+        path (str): Chemin du fichier
+
+    Returns:
+        pandas.DataFrame: Statistiques de couverture par région, département, commune, année.
+    """
+    table = pyarrow.parquet.read_table(path)
+    return table.to_pandas(types_mapper={pyarrow.int32(): pandas.Int64Dtype()}.get)
+
+
 def load_cities():
     path = conf.download.contours.communes.chemin
-    return open_json(path)
+    return open_json_with_cache(path)
 
 
 def load_departments():
     path = conf.download.contours.departements.chemin
-    return open_json(path)
+    return open_json_with_cache(path)
 
 
 def load_regions():
     path = conf.download.contours.regions.chemin
+    return open_json_with_cache(path)
+
+
+def get_site_page_path(site_path: str, zone_column: str):
+    """Construit le chemin d'une carte pré-calculée.
+
+    Args:
+        site_path (str): Dossier du site pré-calculé
+        zone_column (str): Colonne de zone de l'échelle
+
+    Returns:
+        str: Chemin du fichier HTML compressé
+    """
+    return os.path.join(site_path, f"{zone_column}.html.gz")
+
+
+def create_site_directory(site_path: str):
+    """Crée un dossier vide à côté du site pré-calculé, dans lequel construire sa nouvelle version.
+
+    Args:
+        site_path (str): Dossier du site pré-calculé
+
+    Returns:
+        str: Chemin du dossier créé
+    """
+    parent_path = os.path.dirname(site_path) or "."
+    os.makedirs(parent_path, exist_ok=True)
+    return tempfile.mkdtemp(dir=parent_path)
+
+
+def replace_site_directory(new_site_path: str, site_path: str):
+    """Remplace le site pré-calculé par la version construite dans un autre dossier,
+    afin qu'aucun fichier de l'ancienne version ne subsiste.
+
+    Args:
+        new_site_path (str): Dossier de la nouvelle version, créé par create_site_directory
+        site_path (str): Dossier du site pré-calculé
+    """
+    old_site_path = f"{site_path}.ancien"
+    shutil.rmtree(old_site_path, ignore_errors=True)
+    if os.path.exists(site_path):
+        os.replace(site_path, old_site_path)
+    os.replace(new_site_path, site_path)
+    shutil.rmtree(old_site_path, ignore_errors=True)
+
+
+def load_site_index(site_path: str):
+    """Charge l'index d'un site pré-calculé.
+
+    Args:
+        site_path (str): Dossier du site pré-calculé
+
+    Returns:
+        dict: Index du site, ou None si le site n'existe pas
+    """
+    path = os.path.join(site_path, "index.json")
+    if not os.path.exists(path):
+        return None
     return open_json(path)
+
+
+def load_site_page(site_path: str, zone_column: str):
+    """Charge le code HTML d'une carte pré-calculée."""
+    return open_gzip(get_site_page_path(site_path, zone_column))
@@ -0,0 +1,49 @@
+""" Ce module pré-calcule les cartes de l'application web (une par échelle, contenant
+toutes les années et tous les indicateurs) sous forme de fichiers statiques compressés.
+"""
+from datetime import datetime
+import json
+import os
+
+from decp_couverture import conf
+from decp_couverture import load
+from decp_couverture import stats
+from decp_couverture import web
+
+
+def run():
+    """Pré-calcule la carte de chaque échelle, pour toutes les années et tous les indicateurs,
+    à partir des statistiques de couverture. Sauvegarde les résultats sur le disque.
+    """
+    site_path = conf.site.chemin
+    # Le site est construit à côté puis substitué à l'ancien : aucune page périmée ne subsiste
+    new_site_path = load.create_site_directory(site_path)
+    coverage = load.load_coverage(conf.coverage.chemin)
+    contours = {
+        "Communes": load.load_cities(),
+        "Départements": load.load_departments(),
+        "Régions": load.load_regions(),
+    }
+    for scale, zone_column in stats.SCALES.items():
+        stats_by_year = {
+            year: stats.compute_scale_stats(coverage, year, scale)
+            for year in conf.web.annees
+        }
+        folium_map = web.build_selector_map(
+            scale, contours[scale], stats_by_year, scale.lower()
+        )
+        path = load.get_site_page_path(new_site_path, zone_column)
+        load.save_gzip(folium_map.get_root().render(), path)
+        print(f"Carte pré-calculée : {load.get_site_page_path(site_path, zone_column)}")
+    index = {
+        "date": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        # Une carte par échelle, l'année et l'indicateur étant sélectionnés dans le navigateur
+        "format": "selecteur",
+        "annees": conf.web.annees,
+        "echelles": list(stats.SCALES),
+        "indicateurs": list(stats.INDICATORS.values()),
+    }
+    path = os.path.join(new_site_path, "index.json")
+    with open(path, "w", encoding="utf-8") as file_writer:
+        json.dump(index, file_writer, ensure_ascii=False, indent=2)
+    load.replace_site_directory(new_site_path, site_path)
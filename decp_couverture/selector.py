@@ -0,0 +1,215 @@
+""" Ce module ajoute à une carte folium la sélection de l'année et de l'indicateur, exécutée dans le navigateur.
+Les contours sont transmis une seule fois avec la table des indicateurs de toutes les années :
+changer d'année ou d'indicateur recolore les zones sans échange avec le serveur.
+"""
+from branca.element import MacroElement
+from branca.utilities import color_brewer
+from jinja2 import Template
+
+
+class ClientSideSelector(MacroElement):
+    """Contrôles de la carte (année, indicateur), légende et tableaux des zones les plus représentées,
+    recalculés dans le navigateur à partir de la table construite par stats.build_indicator_table.
+    """
+
+    _template = Template(
+        """
+        {% macro header(this, kwargs) %}
+        <style>
+            .selecteur-controles, .selecteur-legende {
+                background: white; padding: 6px 8px; border-radius: 4px;
+                box-shadow: 0 0 6px rgba(0, 0, 0, 0.3); font: 12px sans-serif;
+            }
+            .selecteur-controles select { display: block; margin: 2px 0 6px 0; max-width: 260px; }
+            .selecteur-legende i { display: inline-block; width: 14px; height: 12px; margin-right: 4px; opacity: 0.7; }
+            .selecteur-resume { font: 14px sans-serif; padding: 8px 0; }
+            .selecteur-resume table { display: inline-table; border-collapse: collapse; margin: 6px 24px 0 0; vertical-align: top; }
+            .selecteur-resume td, .selecteur-resume th { border-bottom: 1px solid #ddd; padding: 3px 10px; }
+        </style>
+        {% endmacro %}
+
+        {% macro html(this, kwargs) %}
+        <div id="{{ this.get_name() }}_resume" class="selecteur-resume"></div>
+        {% endmacro %}
+
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.data|tojson }};
+            var options = {{ this.options|tojson }};
+            var layer = {{ this.layer.get_name() }};
+            var map = {{ this._parent.get_name() }};
+            var positions = {};
+            data.codes.forEach(function(code, i) { positions[code] = i; });
+            var labels = {};
+            options.indicateurs.forEach(function(indicator) { labels[indicator[0]] = indicator[1]; });
+            var state = {annee: options.annees[0], indicateur: options.indicateurs[0][0]};
+
+            function format(value) {
+                return options.evolution && value > 0 ? "+" + value : String(value);
+            }
+            function getValue(values, feature) {
+                var i = positions[feature.properties[options.cle]];
+                return i === undefined ? null : values[i];
+            }
+            // Classes d'égale amplitude entre le minimum et le maximum, comme folium.Choropleth.
+            // Les évolutions sont réparties symétriquement autour de 0 : une baisse et une hausse
+            // de même ampleur sont ainsi situées de part et d'autre de la classe centrale.
+            function computeBins(values) {
+                var min = Infinity, max = -Infinity;
+                values.forEach(function(value) {
+                    if (value !== null) { min = Math.min(min, value); max = Math.max(max, value); }
+                });
+                if (options.evolution) {
+                    max = Math.max(Math.abs(min), Math.abs(max));
+                    min = -max;
+                }
+                var edges = [];
+                for (var i = 0; i <= options.couleurs.length; i++) {
+                    edges.push(min + (max - min) * i / options.couleurs.length);
+                }
+                return edges;
+            }
+            function getColor(value, edges) {
+                var n = options.couleurs.length;
+                var width = edges[n] - edges[0];
+                var i = width > 0 ? Math.floor((value - edges[0]) / width * n) : 0;
+                return options.couleurs[Math.max(0, Math.min(i, n - 1))];
+            }
+            function topZones(column) {
+                return data.codes
+                    .map(function(code, i) { return [code, data.valeurs[state.annee][column][i]]; })
+                    .filter(function(zone) { return zone[1] !== null; })
+                    .sort(function(a, b) { return b[1] - a[1]; })
+                    .slice(0, 5);
+            }
+            function renderTable(title, header, zones, unit) {
+                var rows = zones.map(function(zone) {
+                    return "<tr><td>" + zone[0] + "</td><td>" + format(zone[1]) + unit + "</td></tr>";
+                }).join("");
+                return "<table><tr><th colspan='2'>" + title + "</th></tr><tr><th>Code</th><th>"
+                    + header + "</th></tr>" + rows + "</table>";
+            }
+
+            var legend = L.control({position: "bottomright"});
+            legend.onAdd = function() {
+                this._div = L.DomUtil.create("div", "selecteur-legende");
+                return this._div;
+            };
+            legend.addTo(map);
+
+            function update() {
+                var values = data.valeurs[state.annee][state.indicateur];
+                var edges = computeBins(values);
+                layer.setStyle(function(feature) {
+                    var value = getValue(values, feature);
+                    if (value === null) {
+                        return {fillColor: "black", fillOpacity: 0.3, weight: 0};
+                    }
+                    return {fillColor: getColor(value, edges), fillOpacity: 0.7, weight: 0};
+                });
+                var html = "<b>" + labels[state.indicateur] + "</b>";
+                if (values.every(function(value) { return value === null; })) {
+                    // Indicateur absent de l'instantané (ex : SIRETs des anciens artifacts)
+                    html += "<br>aucune donnée";
+                } else {
+                    options.couleurs.forEach(function(color, i) {
+                        html += "<br><i style='background:" + color + "'></i>"
+                            + Math.round(edges[i]) + " – " + Math.round(edges[i + 1]);
+                    });
+                }
+                legend._div.innerHTML = html;
+                var markets = data.valeurs[state.annee].nombre_marches;
+                var numZones = markets.filter(function(value) { return value !== null; }).length;
+                var tables = options.tableaux;
+                document.getElementById("{{ this.get_name() }}_resume").innerHTML =
+                    "<div>" + numZones + " " + options.zones + " ont des marchés représentés dans les DECP au cours de l'année "
+                    + state.annee + ".</div>"
+                    + renderTable(tables.marches, tables.entete_marches, topZones("nombre_marches"), " marchés")
+                    + renderTable(tables.sirens, tables.entete_sirens, topZones("pourcentage_sirens_couverts"), tables.unite_sirens);
+            }
+
+            var controls = L.control({position: "topright"});
+            controls.onAdd = function() {
+                var div = L.DomUtil.create("div", "selecteur-controles");
+                div.innerHTML = "Année<select name='annee'>"
+                    + options.annees.map(function(year) { return "<option>" + year + "</option>"; }).join("")
+                    + "</select>Indicateur à représenter<select name='indicateur'>"
+                    + options.indicateurs.map(function(indicator) {
+                        return "<option value='" + indicator[0] + "'>" + indicator[1] + "</option>";
+                    }).join("")
+                    + "</select>";
+                L.DomEvent.disableClickPropagation(div);
+                div.querySelectorAll("select").forEach(function(select) {
+                    select.addEventListener("change", function() {
+                        state[select.name] = select.value;
+                        update();
+                    });
+                });
+                return div;
+            };
+            controls.addTo(map);
+
+            layer.bindTooltip(function(sublayer) {
+                var feature = sublayer.feature;
+                var name = feature.properties[options.nom] || feature.properties[options.cle];
+                var value = getValue(data.valeurs[state.annee][state.indicateur], feature);
+                return name + " : " + (value === null ? "aucune donnée" : format(value));
+            }, {sticky: true});
+            update();
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(
+        self,
+        layer,
+        data: dict,
+        years: list,
+        indicators: list,
+        key: str,
+        name_property: str,
+        zones_label: str,
+        fill_color: str = "YlGn",
+        delta: bool = False,
+    ):
+        """
+        Args:
+            layer (folium.GeoJson ou folium.TopoJson): Couche des contours à colorer
+            data (dict): Table des indicateurs construite par stats.build_indicator_table
+            years (list): Années proposées
+            indicators (list): Couples (colonne, libellé) des indicateurs proposés, dans l'ordre d'affichage
+            key (str): Propriété des contours contenant le code de la zone
+            name_property (str): Propriété des contours contenant le nom de la zone
+            zones_label (str): Désignation des zones dans le texte de la page (ex : départements)
+            fill_color (str, optional): Palette de couleurs (color brewer). Defaults to "YlGn".
+            delta (bool, optional): Si les valeurs sont des évolutions entre deux dates. Defaults to False.
+        """
+        super().__init__()
+        self._name = "ClientSideSelector"
+        self.layer = layer
+        self.data = data
+        self.options = {
+            "annees": [str(year) for year in years],
+            "indicateurs": indicators,
+            "cle": key,
+            "nom": name_property,
+            "zones": zones_label,
+            "couleurs": color_brewer(fill_color, n=6),
+            "evolution": delta,
+            "tableaux": {
+                "marches": "Plus forte hausse du nombre de marchés"
+                if delta
+                else "Plus grand nombre de marchés",
+                "entete_marches": "Evolution du nombre de marchés"
+                if delta
+                else "Nombre de marchés",
+                "sirens": "Plus forte hausse des acheteurs publics représentés"
+                if delta
+                else "Plus d'acheteurs publics représentés",
+                "entete_sirens": "Evolution des acheteurs publics représentés"
+                if delta
+                else "Acheteurs publics représentés",
+                "unite_sirens": " points" if delta else "%",
+            },
+        }
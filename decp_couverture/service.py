@@ -0,0 +1,432 @@
+""" Ce module expose les statistiques de couverture dans un service HTTP local (commande serve).
+Les statistiques sont chargées en mémoire dans des index par SIREN, commune, département et région,
+puis rechargées sans interruption du service lorsque les fichiers de la commande coverage changent.
+
+Requêtes disponibles (réponses JSON, compressées en gzip si le client l'accepte) :
+    /                                  années disponibles et date de chargement
+    /{type}/{code}                     statistiques d'une zone ou d'un SIREN, par année
+    /{type}?debut=..&fin=..            statistiques des codes compris entre debut et fin (inclus)
+    /{type}?prefixe=..                 statistiques des codes commençant par un préfixe
+Le type est sirens, communes, departements ou regions. Les paramètres annee, annee_min et annee_max
+restreignent les années renvoyées, et limite le nombre de résultats d'un intervalle.
+"""
+import bisect
+from datetime import datetime
+import gzip
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import pandas
+
+from decp_couverture import conf
+from decp_couverture import load
+from decp_couverture import stats
+
+# Types de requêtes sur les zones et échelle correspondante
+ZONE_TYPES = {
+    "communes": "Communes",
+    "departements": "Départements",
+    "regions": "Régions",
+}
+
+
+class QueryError(Exception):
+    """Requête invalide, associée au code de statut HTTP à renvoyer."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Index:
+    """Index en mémoire de statistiques par code (zone ou SIREN) et par année.
+    Les codes sont également conservés triés pour répondre aux requêtes sur un intervalle par dichotomie.
+    """
+
+    def __init__(self, entries: dict):
+        """
+        Args:
+            entries (dict): Couple (attributs du code, statistiques par année) par code
+        """
+        self.entries = entries
+        self.codes = sorted(entries)
+
+    def get(self, code: str, years: range = None):
+        """Obtient les statistiques d'un code.
+
+        Args:
+            code (str): Code recherché
+            years (range, optional): Années à renvoyer. Defaults to None (toutes).
+
+        Returns:
+            dict: Attributs et statistiques par année du code, ou None si le code est absent
+        """
+        entry = self.entries.get(code)
+        if entry is None:
+            return None
+        attributes, year_records = entry
+        if years is not None:
+            year_records = {
+                year: record for year, record in year_records.items() if year in years
+            }
+        return {"code": code, **attributes, "annees": year_records}
+
+    def get_range(self, first_code: str, last_code: str, years: range, limit: int):
+        """Obtient les statistiques des codes compris entre deux bornes (incluses).
+
+        Args:
+            first_code (str): Premier code
+            last_code (str): Dernier code
+            years (range): Années à renvoyer, ou None pour toutes
+            limit (int): Nombre maximal de résultats
+
+        Returns:
+            list: Attributs et statistiques par année de chaque code, dans l'ordre des codes
+        """
+        results = []
+        start = bisect.bisect_left(self.codes, first_code)
+        stop = bisect.bisect_right(self.codes, last_code)
+        for code in self.codes[start : min(stop, start + limit)]:
+            results.append(self.get(code, years))
+        return results
+
+
+def to_records(dataframe: pandas.DataFrame, columns: list):
+    """Convertit des colonnes d'un DataFrame en dictionnaires sérialisables en JSON.
+
+    Args:
+        dataframe (pandas.DataFrame): Données
+        columns (list): Colonnes à conserver
+
+    Returns:
+        list: Un dictionnaire par ligne (valeurs manquantes à None)
+    """
+    return (
+        dataframe[columns]
+        .astype(object)
+        .where(dataframe[columns].notna(), None)
+        .to_dict("records")
+    )
+
+
+def build_zone_indexes(coverage: pandas.DataFrame):
+    """Construit les index des statistiques de couverture par commune, département et région.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture
+
+    Returns:
+        dict: Index par type de zone
+    """
+    indexes = dict()
+    years = sorted(int(year) for year in coverage.annee_marche.unique())
+    for zone_type, scale in ZONE_TYPES.items():
+        zone_column = stats.SCALES[scale]
+        entries = dict()
+        for year in years:
+            zone_stats = stats.compute_scale_stats(coverage, year, scale)
+            columns = list(zone_stats.columns[1:])
+            for code, record in zip(
+                zone_stats[zone_column], to_records(zone_stats, columns)
+            ):
+                entries.setdefault(code, (dict(), dict()))[1][year] = record
+        indexes[zone_type] = Index(entries)
+    return indexes
+
+
+def build_sirens_index(
+    sirens_coverage: pandas.DataFrame, sirens_reference: pandas.DataFrame
+):
+    """Construit l'index par SIREN : référentiel des SIRENs publics et marchés des DECP par année.
+    Un SIREN public absent des DECP est présent dans l'index, sans statistiques annuelles.
+
+    Args:
+        sirens_coverage (pandas.DataFrame): Marchés et SIRETs des DECP par année et SIREN acheteur
+        sirens_reference (pandas.DataFrame): Commune et nombre d'établissements de chaque SIREN public
+
+    Returns:
+        Index: Index par SIREN
+    """
+    entries = dict()
+    for siren, record in zip(
+        sirens_reference.siren_acheteur,
+        to_records(
+            sirens_reference, ["code_commune_acheteur", "nombre_sirets_insee"]
+        ),
+    ):
+        entries[siren] = ({"sirene": record}, dict())
+    sirens_coverage = sirens_coverage.merge(
+        sirens_reference[["siren_acheteur", "nombre_sirets_insee"]],
+        how="left",
+        on="siren_acheteur",
+    )
+    sirens_coverage["pourcentage_sirets_couverts"] = stats.coverage_percentage(
+        sirens_coverage.nombre_sirets_decp,
+        sirens_coverage.nombre_sirets_insee,
+        clip_percentage=True,
+    ).where(sirens_coverage.nombre_sirets_insee.notna()).astype("Int64")
+    columns = [
+        "code_region_acheteur",
+        "code_departement_acheteur",
+        "code_commune_acheteur",
+        "nombre_marches",
+        "nombre_sirets_decp",
+        "pourcentage_sirets_couverts",
+    ]
+    for siren, year, record in zip(
+        sirens_coverage.siren_acheteur,
+        sirens_coverage.annee_marche,
+        to_records(sirens_coverage, columns),
+    ):
+        entries.setdefault(siren, ({"sirene": None}, dict()))[1][int(year)] = record
+    return Index(entries)
+
+
+def get_source_paths():
+    """Obtient les chemins des fichiers chargés par le service.
+    Le fichier parquet des statistiques est préféré au fichier CSV lorsqu'il existe.
+
+    Returns:
+        dict: Chemin par source (couverture, sirens, reference_sirens)
+    """
+    coverage_path = conf.coverage.chemin_parquet
+    if not os.path.exists(coverage_path):
+        coverage_path = conf.coverage.chemin
+    return {
+        "couverture": coverage_path,
+        "sirens": conf.coverage.chemin_sirens,
+        "reference_sirens": conf.coverage.chemin_reference_sirens,
+    }
+
+
+def get_source_mtimes(paths: dict):
+    """Obtient la date de modification de chaque source (None si le fichier n'existe pas)."""
+    return {
+        name: os.path.getmtime(path) if os.path.exists(path) else None
+        for name, path in paths.items()
+    }
+
+
+class Snapshot:
+    """Ensemble des index construits à partir d'une version des fichiers de statistiques.
+    Un instantané n'est jamais modifié : le rechargement en construit un nouveau puis le substitue.
+    """
+
+    def __init__(self, paths: dict, mtimes: dict):
+        """
+        Args:
+            paths (dict): Chemin par source
+            mtimes (dict): Date de modification par source, lue avant le chargement
+        """
+        self.mtimes = mtimes
+        if paths["couverture"].endswith(".parquet"):
+            coverage = load.load_coverage_from_parquet_file(paths["couverture"])
+        else:
+            coverage = load.load_coverage(paths["couverture"])
+        self.years = sorted(int(year) for year in coverage.annee_marche.unique())
+        self.indexes = build_zone_indexes(coverage)
+        if mtimes["sirens"] is not None and mtimes["reference_sirens"] is not None:
+            self.indexes["sirens"] = build_sirens_index(
+                load.load_sirens_coverage(paths["sirens"]),
+                load.load_sirens_reference(paths["reference_sirens"]),
+            )
+        else:
+            logging.warning("Statistiques par SIREN absentes : index des SIRENs vide")
+            self.indexes["sirens"] = Index(dict())
+        self.loaded_at = datetime.now()
+
+
+def parse_int(params: dict, name: str):
+    """Lit un paramètre entier facultatif d'une requête."""
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(400, f"Le paramètre {name} doit être un entier : {value}")
+
+
+class CoverageService:
+    """Répond aux requêtes à partir de l'instantané courant, rechargé lorsque les sources changent."""
+
+    def __init__(self):
+        paths = get_source_paths()
+        self.snapshot = Snapshot(paths, get_source_mtimes(paths))
+        print(f"Statistiques chargées : {self.describe()}")
+
+    def describe(self):
+        """Décrit l'instantané courant.
+
+        Returns:
+            dict: Années disponibles, date de chargement et nombre de codes par type
+        """
+        snapshot = self.snapshot
+        return {
+            "annees": snapshot.years,
+            "chargement": snapshot.loaded_at.isoformat(timespec="seconds"),
+            "nombre_codes": {
+                name: len(index.codes) for name, index in snapshot.indexes.items()
+            },
+        }
+
+    def query(self, parts: list, params: dict):
+        """Répond à une requête.
+
+        Args:
+            parts (list): Segments du chemin de la requête
+            params (dict): Paramètres de la requête
+
+        Returns:
+            Réponse sérialisable en JSON
+        """
+        # L'instantané est lu une seule fois : un rechargement simultané ne modifie pas la réponse
+        snapshot = self.snapshot
+        if len(parts) == 0:
+            return self.describe()
+        index = snapshot.indexes.get(parts[0])
+        if index is None or len(parts) > 2:
+            raise QueryError(404, f"Requête inconnue : /{'/'.join(parts)}")
+        years = None
+        year = parse_int(params, "annee")
+        first_year = parse_int(params, "annee_min")
+        last_year = parse_int(params, "annee_max")
+        if year is not None:
+            years = range(year, year + 1)
+        elif first_year is not None or last_year is not None:
+            first_year = first_year if first_year is not None else snapshot.years[0]
+            last_year = last_year if last_year is not None else snapshot.years[-1]
+            years = range(first_year, last_year + 1)
+        if len(parts) == 2:
+            result = index.get(parts[1], years)
+            if result is None:
+                raise QueryError(404, f"Code inconnu : {parts[1]}")
+            return result
+        if "prefixe" in params:
+            first_code = params["prefixe"]
+            last_code = params["prefixe"] + "\uffff"
+        elif "debut" in params and "fin" in params:
+            first_code, last_code = params["debut"], params["fin"]
+        else:
+            raise QueryError(400, "Paramètres prefixe, ou debut et fin, attendus")
+        limit = parse_int(params, "limite")
+        if limit is None:
+            limit = conf.service.limite_resultats
+        elif limit <= 0:
+            raise QueryError(400, f"Le paramètre limite doit être positif : {limit}")
+        limit = min(limit, conf.service.limite_resultats)
+        return index.get_range(first_code, last_code, years, limit)
+
+    def reload_if_changed(self, previous_mtimes: dict):
+        """Recharge les statistiques si les sources ont changé depuis le chargement de l'instantané
+        courant. Une source n'est rechargée qu'une fois stable (date de modification inchangée
+        depuis la vérification précédente), pour ne pas lire un fichier en cours d'écriture.
+
+        Args:
+            previous_mtimes (dict): Dates de modification lues lors de la vérification précédente
+
+        Returns:
+            dict: Dates de modification lues lors de cette vérification
+        """
+        paths = get_source_paths()
+        mtimes = get_source_mtimes(paths)
+        if mtimes != self.snapshot.mtimes and mtimes == previous_mtimes:
+            started_at = time.perf_counter()
+            self.snapshot = Snapshot(paths, mtimes)
+            print(
+                f"Statistiques rechargées en {time.perf_counter() - started_at:.1f}s : {self.describe()}"
+            )
+        return mtimes
+
+    def watch(self):
+        """Vérifie périodiquement les sources et recharge les statistiques lorsqu'elles changent.
+        En cas d'échec, l'instantané précédent continue d'être servi.
+        """
+        mtimes = self.snapshot.mtimes
+        while True:
+            time.sleep(conf.service.intervalle_rechargement)
+            try:
+                mtimes = self.reload_if_changed(mtimes)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Echec du rechargement des statistiques")
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    """Traite une requête HTTP GET du service."""
+
+    # Connexions persistantes : un client enchaînant les requêtes n'ouvre qu'une connexion
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        started_at = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.split("/") if part]
+        params = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        try:
+            status, body = 200, self.server.service.query(parts, params)
+        except QueryError as error:
+            status, body = error.status, {"erreur": str(error)}
+        except Exception:  # pylint: disable=broad-except
+            # Le client reçoit toujours une réponse JSON, le détail de l'erreur reste dans les logs
+            logging.exception(f"Echec de la requête {self.path}")
+            status, body = 500, {"erreur": "Erreur interne du service"}
+        self.send_json(status, body, (time.perf_counter() - started_at) * 1000)
+
+    def send_json(self, status: int, body, duration: float):
+        """Envoie une réponse JSON, compressée si le client l'accepte et si elle est assez grande.
+
+        Args:
+            status (int): Code de statut HTTP
+            body: Réponse sérialisable en JSON
+            duration (float): Durée de traitement de la requête, en ms
+        """
+        content = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        compress = (
+            "gzip" in accept_encoding
+            and len(content) >= conf.service.taille_min_compression
+        )
+        if compress:
+            content = gzip.compress(content)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Server-Timing", f"requete;dur={duration:.3f}")
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def run(host: str = None, port: int = None):
+    """Charge les statistiques et lance le service, jusqu'à l'interruption du processus.
+
+    Args:
+        host (str, optional): Adresse d'écoute. Defaults to None (configuration).
+        port (int, optional): Port d'écoute. Defaults to None (configuration).
+    """
+    host = host or conf.service.hote
+    port = port or conf.service.port
+    service = CoverageService()
+    watcher = threading.Thread(target=service.watch, name="service-reload", daemon=True)
+    watcher.start()
+    server = http.server.ThreadingHTTPServer((host, port), QueryHandler)
+    server.service = service
+    print(f"Service disponible sur http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,96 @@
+""" Ce module conserve en mémoire les statistiques chargées depuis les artifacts de couverture
+(un instantané par exécution hebdomadaire), dans la limite d'un budget mémoire : au-delà,
+les valeurs les moins récemment utilisées sont libérées (LRU).
+"""
+from collections import OrderedDict
+import logging
+import sys
+import threading
+
+import pandas
+
+from decp_couverture import instrumentation
+
+
+def estimate_size(value):
+    """Estime la mémoire occupée par une valeur mise en cache.
+
+    Args:
+        value: DataFrame, ou dictionnaire, liste ou tuple de valeurs
+
+    Returns:
+        int: Taille estimée en octets
+    """
+    if isinstance(value, (pandas.DataFrame, pandas.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(key) + estimate_size(item) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class SnapshotCache:
+    """Cache LRU dont la taille totale des valeurs est bornée.
+    La valeur la plus récemment utilisée est toujours conservée, même si elle dépasse le budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes (int): Taille totale maximale des valeurs, en octets
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: str, key: tuple, func):
+        """Obtient la valeur en cache pour une clé, en la calculant si elle n'existe pas.
+
+        Args:
+            name (str): Nom de la fonction mise en cache (instrumentation et logs)
+            key (tuple): Arguments de la fonction
+            func (Callable): Fonction calculant la valeur à partir des arguments
+
+        Returns:
+            Valeur retournée par la fonction
+        """
+        instrumentation.count_cache(name, "appels")
+        with instrumentation.step(name):
+            with self._lock:
+                entry = self._entries.get((name, key))
+                if entry is not None:
+                    self._entries.move_to_end((name, key))
+                    return entry[0]
+            instrumentation.count_cache(name, "echecs")
+            value = func(*key)
+            self.put((name, key), value, estimate_size(value))
+            return value
+
+    def put(self, cache_key: tuple, value, size: int):
+        """Stocke une valeur puis libère les valeurs les moins récemment utilisées au-delà du budget.
+
+        Args:
+            cache_key (tuple): Clé de la valeur
+            value: Valeur à stocker
+            size (int): Taille de la valeur, en octets
+        """
+        with self._lock:
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[cache_key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                logging.debug(f"Libération de {evicted_key} ({evicted_size} octets)")
+
+    def clear(self):
+        """Libère toutes les valeurs en cache."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,214 @@
+import pandas
+
+# Echelles proposées dans l'application et colonne de zone correspondante
+SCALES = {
+    "Communes": "code_commune_acheteur",
+    "Départements": "code_departement_acheteur",
+    "Régions": "code_region_acheteur",
+}
+
+# Indicateurs proposés dans l'application et colonne correspondante
+INDICATORS = {
+    "Part des acheteurs publics représentés dans les DECP": "pourcentage_sirens_couverts",
+    "Part des établissements publics représentés dans les DECP": "pourcentage_sirets_couverts",
+    "Nombre de marchés recensés dans les DECP": "nombre_marches",
+}
+
+
+def coverage_percentage(
+    decp_counts: pandas.Series, insee_counts: pandas.Series, clip_percentage: bool
+):
+    """Calcule le pourcentage d'entités de la base Sirene représentées dans les DECP.
+
+    Args:
+        decp_counts (pandas.Series): Nombre d'entités présentes dans les DECP
+        insee_counts (pandas.Series): Nombre d'entités de la base Sirene
+        clip_percentage (bool): Si le pourcentage doit être borné entre 0 et 100
+
+    Returns:
+        pandas.Series: Pourcentage arrondi à l'unité
+    """
+    covered = decp_counts.fillna(1) / insee_counts.fillna(1)
+    percentage = (covered * 100).round(0).astype(int)
+    if clip_percentage:
+        percentage = percentage.clip(lower=0, upper=100)
+    return percentage
+
+
+def compute_zone_stats(
+    year_stats: pandas.DataFrame, zone_column: str, clip_percentage: bool = False
+):
+    """Agrège les statistiques de couverture d'une année par zone.
+
+    Args:
+        year_stats (pandas.DataFrame): Statistiques de couverture d'une année
+        zone_column (str): Colonne de zone (commune, département ou région)
+        clip_percentage (bool, optional): Si le pourcentage doit être borné entre 0 et 100. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: Code de zone, nombre de marchés et pourcentages de SIRENs et de SIRETs couverts
+    """
+    zone_stats = (
+        year_stats.groupby([zone_column])
+        .agg(
+            nombre_marches=("nombre_marches", "sum"),
+            nombre_sirens_decp=("nombre_sirens_decp", "sum"),
+            nombre_sirens_insee=("nombre_sirens_insee", "sum"),
+            nombre_sirets_decp=("nombre_sirets_decp", "sum"),
+            nombre_sirets_insee=("nombre_sirets_insee", "sum"),
+        )
+        .reset_index()
+    )
+    zone_stats["pourcentage_sirens_couverts"] = coverage_percentage(
+        zone_stats.nombre_sirens_decp, zone_stats.nombre_sirens_insee, clip_percentage
+    )
+    if year_stats.nombre_sirets_insee.notna().any():
+        zone_stats["pourcentage_sirets_couverts"] = coverage_percentage(
+            zone_stats.nombre_sirets_decp, zone_stats.nombre_sirets_insee, clip_percentage
+        )
+    else:
+        # Artifact antérieur au décompte des SIRETs : l'indicateur est sans valeur
+        zone_stats["pourcentage_sirets_couverts"] = pandas.Series(
+            pandas.NA, index=zone_stats.index, dtype="Int64"
+        )
+    for column in [
+        "nombre_sirens_decp",
+        "nombre_sirens_insee",
+        "nombre_sirets_decp",
+        "nombre_sirets_insee",
+    ]:
+        del zone_stats[column]
+    return zone_stats
+
+
+def compute_scale_stats(coverage: pandas.DataFrame, year: int, scale: str):
+    """Calcule les statistiques de couverture d'une année pour une échelle.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture (toutes années)
+        year (int): Année sélectionnée
+        scale (str): Echelle sélectionnée (clé de SCALES)
+
+    Returns:
+        pandas.DataFrame: Statistiques de couverture par zone
+    """
+    year_stats = coverage[coverage.annee_marche == year]
+    return compute_zone_stats(
+        year_stats, SCALES[scale], clip_percentage=(scale == "Communes")
+    )
+
+
+def compute_year_stats(coverage: pandas.DataFrame, year: int):
+    """Calcule les statistiques de couverture d'une année pour toutes les échelles.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture (toutes années)
+        year (int): Année sélectionnée
+
+    Returns:
+        dict: Statistiques de couverture par zone, pour chaque échelle
+    """
+    return {scale: compute_scale_stats(coverage, year, scale) for scale in SCALES}
+
+
+def group_children(coverage: pandas.DataFrame, parent_column: str, child_column: str):
+    """Associe à chaque zone parente la liste triée de ses zones enfants.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture
+        parent_column (str): Colonne de la zone parente
+        child_column (str): Colonne de la zone enfant
+
+    Returns:
+        dict: Codes des zones enfants par code de zone parente
+    """
+    pairs = coverage[[parent_column, child_column]].dropna().drop_duplicates()
+    return {
+        parent: sorted(children)
+        for parent, children in pairs.groupby(parent_column)[child_column]
+    }
+
+
+def build_zone_indexes(coverage: pandas.DataFrame):
+    """Construit les index hiérarchiques région → départements et département → communes.
+
+    Args:
+        coverage (pandas.DataFrame): Statistiques de couverture
+
+    Returns:
+        dict: Codes des zones enfants par code de zone parente, pour les échelles Régions et Départements
+    """
+    return {
+        "Régions": group_children(
+            coverage, SCALES["Régions"], SCALES["Départements"]
+        ),
+        "Départements": group_children(
+            coverage, SCALES["Départements"], SCALES["Communes"]
+        ),
+    }
+
+
+def slice_zone_stats(stats: pandas.DataFrame, codes: list):
+    """Extrait des statistiques par zone celles d'une liste de zones.
+
+    Args:
+        stats (pandas.DataFrame): Statistiques de couverture par zone
+        codes (list): Codes des zones à conserver
+
+    Returns:
+        pandas.DataFrame: Statistiques de couverture des zones sélectionnées
+    """
+    zone_column = stats.columns[0]
+    return stats[stats[zone_column].isin(codes)]
+
+
+def compute_zone_delta(stats: pandas.DataFrame, previous_stats: pandas.DataFrame):
+    """Calcule l'évolution des statistiques par zone entre deux instantanés.
+    Les statistiques sont alignées sur le code de zone : une zone absente d'un instantané
+    y est comptée pour zéro. Un indicateur sans valeur dans l'un des instantanés reste sans valeur.
+
+    Args:
+        stats (pandas.DataFrame): Statistiques de couverture par zone
+        previous_stats (pandas.DataFrame): Statistiques de couverture par zone de l'instantané de référence
+
+    Returns:
+        pandas.DataFrame: Code de zone et différence de chaque indicateur
+    """
+    zone_column = stats.columns[0]
+    delta = (
+        stats.set_index(zone_column)
+        .subtract(previous_stats.set_index(zone_column), fill_value=0)
+        .astype("Int64")
+    )
+    for column in delta.columns:
+        if stats[column].isna().all() or previous_stats[column].isna().all():
+            delta[column] = pandas.Series(pandas.NA, index=delta.index, dtype="Int64")
+    return delta.reset_index()
+
+
+def build_indicator_table(stats_by_year: dict):
+    """Construit une table compacte des indicateurs de toutes les années, destinée au navigateur :
+    les codes de zones ne sont transmis qu'une fois, et les valeurs de chaque année et de chaque
+    indicateur sont des listes alignées sur ces codes.
+
+    Args:
+        stats_by_year (dict): Statistiques de couverture par zone, pour chaque année
+
+    Returns:
+        dict: Codes des zones (triés) et valeurs par année et par indicateur (None si la zone est absente)
+    """
+    codes = sorted(
+        set().union(*(stats[stats.columns[0]] for stats in stats_by_year.values()))
+    )
+    values = dict()
+    for year, stats in stats_by_year.items():
+        aligned = stats.set_index(stats.columns[0]).reindex(codes)
+        values[str(year)] = {
+            column: aligned[column]
+            .astype("Int64")
+            .astype(object)
+            .where(aligned[column].notna(), None)
+            .tolist()
+            for column in INDICATORS.values()
+        }
+    return {"codes": codes, "valeurs": values}
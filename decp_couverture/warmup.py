@@ -0,0 +1,142 @@
+""" Ce module maintient à jour en arrière-plan les données de l'application web :
+les caches sont remplis au démarrage du serveur puis rafraîchis avant leur expiration,
+sans jamais faire attendre un visiteur lorsqu'une valeur précédente est disponible.
+"""
+import logging
+import threading
+import time
+
+from decp_couverture import conf
+from decp_couverture import instrumentation
+
+_started = False
+_started_lock = threading.Lock()
+
+
+class BackgroundCache:
+    """Cache d'une fonction dont les valeurs sont rafraîchies en arrière-plan (stale-while-revalidate).
+
+    Une valeur plus ancienne qu'une fraction de sa durée de vie (web.prechauffage.ratio_rafraichissement)
+    est renvoyée telle quelle, et un rafraîchissement est lancé dans un thread séparé. Seule la toute
+    première demande d'une valeur attend son calcul, partagé avec les demandes simultanées.
+    """
+
+    def __init__(self, name: str, func, ttl: int):
+        """
+        Args:
+            name (str): Nom du cache (instrumentation et logs)
+            func (Callable): Fonction dont les résultats sont mis en cache
+            ttl (int): Durée de vie d'une valeur, en secondes
+        """
+        self.name = name
+        self.func = func
+        self.ttl = ttl
+        self._entries = dict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def get(self, *args):
+        """Obtient la valeur en cache pour des arguments, en la calculant si elle n'existe pas.
+
+        Returns:
+            Valeur retournée par la fonction
+        """
+        instrumentation.count_cache(self.name, "appels")
+        with instrumentation.step(self.name):
+            with self._lock:
+                entry = self._entries.get(args)
+            if entry is None:
+                instrumentation.count_cache(self.name, "echecs")
+                return self.refresh(*args)
+            value, updated_at = entry
+            refresh_age = self.ttl * conf.web.prechauffage.ratio_rafraichissement
+            if time.monotonic() - updated_at > refresh_age:
+                self.refresh_in_background(*args)
+            return value
+
+    def refresh(self, *args):
+        """Calcule et stocke la valeur pour des arguments. Si un calcul est déjà en cours
+        pour ces arguments, attend son résultat au lieu d'en lancer un second.
+
+        Returns:
+            Valeur retournée par la fonction
+        """
+        with self._lock:
+            pending = self._pending.get(args)
+            is_owner = pending is None
+            if is_owner:
+                pending = self._pending[args] = threading.Event()
+        if not is_owner:
+            pending.wait()
+            with self._lock:
+                entry = self._entries.get(args)
+            if entry is not None:
+                return entry[0]
+            # Le calcul attendu a échoué : il est relancé par ce thread
+            return self.refresh(*args)
+        try:
+            value = self.func(*args)
+            with self._lock:
+                self._entries[args] = (value, time.monotonic())
+            return value
+        finally:
+            with self._lock:
+                del self._pending[args]
+            pending.set()
+
+    def refresh_in_background(self, *args):
+        """Lance le rafraîchissement de la valeur dans un thread séparé,
+        sauf si un calcul est déjà en cours pour ces arguments.
+        """
+        with self._lock:
+            if args in self._pending:
+                return
+        thread = threading.Thread(
+            target=self._refresh_quietly,
+            args=args,
+            name=f"refresh-{self.name}",
+            daemon=True,
+        )
+        thread.start()
+
+    def _refresh_quietly(self, *args):
+        try:
+            self.refresh(*args)
+        except Exception:  # pylint: disable=broad-except
+            # La valeur précédente reste servie jusqu'au prochain rafraîchissement
+            logging.exception(f"Echec du rafraîchissement de {self.name}{args}")
+
+
+def _run_periodically(name: str, task, period: float):
+    while True:
+        started_at = time.monotonic()
+        try:
+            task()
+            logging.debug(
+                f"Préchauffage {name} terminé en {time.monotonic() - started_at:.1f}s"
+            )
+        except Exception:  # pylint: disable=broad-except
+            logging.exception(f"Echec du préchauffage {name}")
+        time.sleep(period)
+
+
+def start(tasks: dict):
+    """Lance en parallèle les tâches de préchauffage, chacune dans un thread qui la répète périodiquement.
+    Les appels suivants sont sans effet : les tâches ne sont lancées qu'une fois par processus.
+
+    Args:
+        tasks (dict): Couple (fonction, période en secondes) par nom de tâche
+    """
+    global _started  # pylint: disable=global-statement
+    with _started_lock:
+        if _started or not conf.web.prechauffage.actif:
+            return
+        _started = True
+    for name, (task, period) in tasks.items():
+        thread = threading.Thread(
+            target=_run_periodically,
+            args=(name, task, period),
+            name=f"warmup-{name}",
+            daemon=True,
+        )
+        thread.start()
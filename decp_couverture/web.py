@@ -1,71 +1,267 @@
+from datetime import datetime
+import os
+import tempfile
+import zipfile
+
 import streamlit as st
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 import folium
-import pandas
 
 from decp_couverture import download
 from decp_couverture import load
 from decp_couverture import artifacts
 from decp_couverture import conf
+from decp_couverture import contours
+from decp_couverture import instrumentation
+from decp_couverture import selector
+from decp_couverture import snapshots
+from decp_couverture import stats as stats_module
+from decp_couverture import warmup
+
+
+# Caches rafraîchis en arrière-plan avant leur expiration (voir le module warmup)
+contours_cache = warmup.BackgroundCache(
+    "cached__download_contours", download.download_contours, ttl=864000
+)
 
 
-@st.cache(ttl=864000)
 def cached__download_contours():
-    """Proxy de la fonction artifacts.get_last_artifact avec cache de 10j"""
-    download.download_contours()
+    """Proxy de la fonction download.download_contours avec cache de 10j rafraîchi en arrière-plan"""
+    contours_cache.get()
+
+
+def get_coverage_artifacts():
+    """Obtient tous les artifacts de couverture disponibles, un par jour d'exécution.
+    L'artifact parquet est préféré à l'artifact CSV produit le même jour.
+
+    Returns:
+        list: Couples (date, url) des artifacts, du plus récent au plus ancien
+    """
+    results = dict()
+    for artifact_name in ["coverage.csv", "coverage.parquet"]:
+        for artifact_datetime, artifact_url in reversed(
+            artifacts.get_all_artifacts(artifact_name)
+        ):
+            results[artifact_datetime.date()] = (artifact_datetime, artifact_url)
+    return sorted(results.values(), reverse=True)
+
+
+coverage_artifacts_cache = warmup.BackgroundCache(
+    "cached__get_coverage_artifacts", get_coverage_artifacts, ttl=43200
+)
+
 
+def cached__get_coverage_artifacts():
+    """Proxy de la fonction get_coverage_artifacts avec cache de 12h rafraîchi en arrière-plan"""
+    return coverage_artifacts_cache.get()
 
-@st.cache(ttl=43200)
-def cached__get_last_artifact(artifact_name: str):
-    """Proxy de la fonction artifacts.get_last_artifact avec cache de 12h"""
-    return artifacts.get_last_artifact(artifact_name)
 
+def get_last_coverage_artifact():
+    """Obtient le dernier artifact de couverture.
 
-@st.cache(ttl=None)
-def cached__get_coverage(coverage_artifact_url: str):
-    """Obtient les dernières statistiques de couverture disponibles sur github.com
+    Returns:
+        (datetime, str): Date et URL de l'artifact
+    """
+    return cached__get_coverage_artifacts()[0]
+
+
+# Statistiques chargées depuis les artifacts de couverture, dans la limite d'un budget mémoire
+snapshot_cache = snapshots.SnapshotCache(
+    conf.web.historique.taille_max_cache_mo * 1024 * 1024
+)
+
+
+def download_coverage(coverage_artifact_url: str):
+    """Télécharge un artifact de couverture depuis github.com et charge ses statistiques.
+    Les fichiers téléchargés sont supprimés une fois chargés.
 
     Args:
-        coverage_artifact_url (str): URL de l'artifact à charger
+        coverage_artifact_url (str): URL de l'artifact à télécharger
 
     Returns:
         pandas.DataFrame: Statistiques de couverture par région, département, commune, année.
     """
     auth = artifacts.get_github_auth()
-    download.download_data_from_url_to_file(
-        coverage_artifact_url, "data/coverage.zip", stream=False, auth=auth
-    )
-    coverage = load.load_data_from_csv_file(
-        "data/coverage.zip",
-        dtype={
-            "code_region_acheteur": str,
-            "code_departement_acheteur": str,
-            "code_commune_acheteur": str,
-            "annee_marche": int,
-            "nombre_marches": int,
-            "nombre_sirens_decp": "Int64",
-            "nombre_sirens_insee": "Int64",
-        },
+    with tempfile.TemporaryDirectory() as directory:
+        zip_path = os.path.join(directory, "coverage.zip")
+        download.download_data_from_url_to_file(
+            coverage_artifact_url, zip_path, stream=False, auth=auth
+        )
+        instrumentation.record_payload("artifact_couverture", os.path.getsize(zip_path))
+        with zipfile.ZipFile(zip_path) as coverage_zip:
+            for name in coverage_zip.namelist():
+                if name.endswith(".parquet"):
+                    return load.load_coverage_from_parquet_file(
+                        coverage_zip.extract(name, directory)
+                    )
+        return load.load_coverage(zip_path)
+
+
+def cached__download_coverage(coverage_artifact_url: str):
+    """Proxy de la fonction download_coverage avec cache LRU borné en mémoire
+    (seule copie en cache des statistiques de l'artifact, dont sont calculés années et index)"""
+    return snapshot_cache.get(
+        "cached__download_coverage", (coverage_artifact_url,), download_coverage
     )
-    return coverage
 
 
-@st.cache(ttl=43200)
+def get_site():
+    """Obtient le dernier site pré-calculé disponible sur github.com, à défaut sur le disque
+
+    Returns:
+        dict: Index du site pré-calculé, ou None si aucun site n'est disponible
+    """
+    site_path = conf.site.chemin
+    try:
+        _, site_artifact_url = artifacts.get_last_artifact(conf.site.nom_artifact)
+    except IndexError:
+        return load.load_site_index(site_path)
+    auth = artifacts.get_github_auth()
+    with tempfile.TemporaryDirectory() as directory:
+        zip_path = os.path.join(directory, "site.zip")
+        download.download_data_from_url_to_file(
+            site_artifact_url, zip_path, stream=False, auth=auth
+        )
+        new_site_path = load.create_site_directory(site_path)
+        with zipfile.ZipFile(zip_path) as site_zip:
+            site_zip.extractall(new_site_path)
+    load.replace_site_directory(new_site_path, site_path)
+    return load.load_site_index(site_path)
+
+
+site_cache = warmup.BackgroundCache("cached__get_site", get_site, ttl=43200)
+
+
+def cached__get_site():
+    """Proxy de la fonction get_site avec cache de 12h rafraîchi en arrière-plan"""
+    return site_cache.get()
+
+
+cities_cache = warmup.BackgroundCache(
+    "cached__load_cities", load.load_cities, ttl=43200
+)
+departments_cache = warmup.BackgroundCache(
+    "cached__load_departments", load.load_departments, ttl=43200
+)
+regions_cache = warmup.BackgroundCache(
+    "cached__load_regions", load.load_regions, ttl=43200
+)
+
+
 def cached__load_cities():
-    """Proxy de la fonction load.load_cities avec cache de 12h"""
-    return load.load_cities()
+    """Proxy de la fonction load.load_cities avec cache de 12h rafraîchi en arrière-plan"""
+    return cities_cache.get()
 
 
-@st.cache(ttl=43200)
 def cached__load_departments():
-    """Proxy de la fonction load.load_cities avec cache de 12h"""
-    return load.load_departments()
+    """Proxy de la fonction load.load_departments avec cache de 12h rafraîchi en arrière-plan"""
+    return departments_cache.get()
 
 
-@st.cache(ttl=43200)
 def cached__load_regions():
-    """Proxy de la fonction load.load_regions avec cache de 12h"""
-    return load.load_regions()
+    """Proxy de la fonction load.load_regions avec cache de 12h rafraîchi en arrière-plan"""
+    return regions_cache.get()
+
+
+def get_zone_names(scale: str):
+    """Obtient les noms des régions ou des départements à partir de leurs contours
+
+    Args:
+        scale (str): Echelle (Départements ou Régions)
+
+    Returns:
+        dict: Nom de chaque zone par code de zone
+    """
+    if scale == "Départements":
+        geo_data = cached__load_departments()
+    elif scale == "Régions":
+        geo_data = cached__load_regions()
+    else:
+        raise ValueError(f"Echelle inconnue : {scale}")
+    return {
+        feature["properties"]["code"]: feature["properties"]["nom"]
+        for feature in geo_data["features"]
+    }
+
+
+zone_names_cache = warmup.BackgroundCache(
+    "cached__get_zone_names", get_zone_names, ttl=43200
+)
+
+
+def cached__get_zone_names(scale: str):
+    """Proxy de la fonction get_zone_names avec cache de 12h rafraîchi en arrière-plan"""
+    return zone_names_cache.get(scale)
+
+
+def load_children_contours(scale: str, codes: tuple):
+    """Obtient les contours d'une sélection de zones
+
+    Args:
+        scale (str): Echelle des zones (Communes ou Départements)
+        codes (tuple): Codes des zones à conserver
+
+    Returns:
+        dict: Données géographiques réduites aux zones sélectionnées
+    """
+    if scale == "Communes":
+        return contours.filter_topojson(cached__load_cities(), "poly", "ID", codes)
+    elif scale == "Départements":
+        return contours.filter_geojson(cached__load_departments(), "code", codes)
+    raise ValueError(f"Echelle inconnue : {scale}")
+
+
+children_contours_cache = warmup.BackgroundCache(
+    "cached__load_children_contours", load_children_contours, ttl=43200
+)
+
+
+def cached__load_children_contours(scale: str, codes: tuple):
+    """Proxy de la fonction load_children_contours avec cache de 12h rafraîchi en arrière-plan"""
+    return children_contours_cache.get(scale, codes)
+
+
+def get_zone_indexes(coverage_artifact_url: str):
+    """Obtient les index hiérarchiques région → départements → communes d'un artifact de couverture
+
+    Args:
+        coverage_artifact_url (str): URL de l'artifact de couverture
+
+    Returns:
+        dict: Codes des zones enfants par code de zone parente, pour les échelles Régions et Départements
+    """
+    return stats_module.build_zone_indexes(
+        cached__download_coverage(coverage_artifact_url)
+    )
+
+
+def cached__get_zone_indexes(coverage_artifact_url: str):
+    """Proxy de la fonction get_zone_indexes avec cache LRU borné en mémoire"""
+    return snapshot_cache.get(
+        "cached__get_zone_indexes", (coverage_artifact_url,), get_zone_indexes
+    )
+
+
+def get_year_stats(coverage_artifact_url: str, year: int):
+    """Obtient les statistiques de couverture d'une année agrégées à chaque échelle
+
+    Args:
+        coverage_artifact_url (str): URL de l'artifact de couverture
+        year (int): Année sélectionnée
+
+    Returns:
+        dict: Statistiques de couverture par zone, pour chaque échelle
+    """
+    return stats_module.compute_year_stats(
+        cached__download_coverage(coverage_artifact_url), year
+    )
+
+
+def cached__get_year_stats(coverage_artifact_url: str, year: int):
+    """Proxy de la fonction get_year_stats avec cache LRU borné en mémoire"""
+    return snapshot_cache.get(
+        "cached__get_year_stats", (coverage_artifact_url, year), get_year_stats
+    )
 
 
 # @st.cache(ttl=86400)
@@ -96,111 +292,309 @@ def contours_layer_geojson(geo_data):
 
 
 # @st.cache(ttl=86400)
-def chloropleth_layer(
-    key_on: str,
-    key_column: str,
-    geo_data: dict,
-    data_column: str,
-    decp_stats: pandas.DataFrame,
-    topojson_key=None,
-    legend: str = None,
-    tooltip_fields: list = None,
-    tooltip_aliases: list = None
+def init_map(height: int = None):
+    """Initialise une carte folium.
+
+    Args:
+        height (int, optional): Hauteur de la carte en pixels. Defaults to None (toute la page).
+
+    Returns:
+        folium.Map
+    """
+    return folium.Map(
+        height="100%" if height is None else height,
+        location=[47, 2],
+        zoom_start=6,
+        tiles=conf.web.folium.tiles,
+        attr=conf.web.folium.attribution,
+        # crs=None #'EPSG4326' #'EPSG3857'
+    )
+
+
+def warm_up_contours():
+    """Télécharge les contours si nécessaire et les recharge dans les caches."""
+    cached__download_contours()
+    cities_cache.refresh()
+    departments_cache.refresh()
+    regions_cache.refresh()
+
+
+def warm_up_coverage():
+    """Rafraîchit la recherche du dernier artifact de couverture, puis charge
+    ses statistiques dans les caches s'il s'agit d'un nouvel artifact."""
+    coverage_artifacts_cache.refresh()
+    _, coverage_artifact_url = get_last_coverage_artifact()
+    cached__get_zone_indexes(coverage_artifact_url)
+    for year in conf.web.annees:
+        cached__get_year_stats(coverage_artifact_url, year)
+
+
+def start_warmup():
+    """Lance le préchauffage des caches en arrière-plan (une seule fois par processus)."""
+    refresh_ratio = conf.web.prechauffage.ratio_rafraichissement
+    # Chaque tâche est relancée avant l'expiration des caches qu'elle remplit
+    contours_ttl = min(
+        cities_cache.ttl, departments_cache.ttl, regions_cache.ttl
+    )
+    tasks = {
+        "contours": (warm_up_contours, contours_ttl * refresh_ratio),
+        "couverture": (warm_up_coverage, coverage_artifacts_cache.ttl * refresh_ratio),
+    }
+    if conf.web.utiliser_site_precalcule:
+        tasks["site"] = (site_cache.refresh, site_cache.ttl * refresh_ratio)
+    warmup.start(tasks)
+
+
+# Propriétés des contours contenant le code et le nom de la zone, pour chaque échelle
+CONTOURS_PROPERTIES = {
+    "Communes": ("ID", "ID"),
+    "Départements": ("code", "nom"),
+    "Régions": ("code", "nom"),
+}
+
+
+def build_selector_map(
+    selected_scale: str,
+    topo: dict,
+    stats_by_year: dict,
+    zones_label: str,
+    fit_bounds: bool = False,
+    delta: bool = False,
 ):
-    """Construit une couche chloropleth pour Folium à partir de données géographiques (format topojson ou geojson).
+    """Construit la carte folium d'une échelle pour toutes les années et tous les indicateurs.
+    Les contours sont transmis une seule fois, et la sélection de l'année et de l'indicateur
+    recolore les zones dans le navigateur (voir le module selector).
 
     Args:
-        key_on (str): [description]
-        key_column (str): [description]
-        geo_data (dict): Données géographiques (format geojson ou topojson)
-        decp_stats (pandas.DataFrame): Données pour la couleur du chloropleth
-        topojson_key (str, optional): Clé topojson. Defaults to None.
+        selected_scale (str): Echelle (Communes, Départements ou Régions)
+        topo (dict): Données géographiques de l'échelle (format geojson ou topojson)
+        stats_by_year (dict): Statistiques de couverture par zone, pour chaque année
+        zones_label (str): Désignation des zones dans le texte de la page (ex : départements)
+        fit_bounds (bool, optional): Si la carte doit être centrée sur les contours. Defaults to False.
+        delta (bool, optional): Si les statistiques sont des évolutions entre deux dates. Defaults to False.
 
     Returns:
-        folium.Choropleth: Couche affichant le choropleth
+        folium.Map
+    """
+    if selected_scale == "Communes":
+        layer = contours_layer_topojson(topo, "objects.poly")
+    else:
+        layer = contours_layer_geojson(topo)
+    folium_map = init_map(height=conf.web.hauteur_carte)
+    layer.add_to(folium_map)
+    key, name_property = CONTOURS_PROPERTIES[selected_scale]
+    selector.ClientSideSelector(
+        layer,
+        stats_module.build_indicator_table(stats_by_year),
+        list(stats_by_year),
+        [(column, legend) for legend, column in stats_module.INDICATORS.items()],
+        key,
+        name_property,
+        zones_label,
+        fill_color="RdYlGn" if delta else "YlGn",
+        delta=delta,
+    ).add_to(folium_map)
+    # Les bornes d'un topojson ne peuvent être calculées par folium que s'il est quantifié
+    if fit_bounds and (selected_scale != "Communes" or "transform" in topo):
+        folium_map.fit_bounds(layer.get_bounds())
+    return folium_map
+
+
+def display_map_html(html: str):
+    """Affiche le code HTML d'une carte, et des tableaux situés sous la carte, dans la page.
+
+    Args:
+        html (str): Code HTML de la carte
     """
-    decp_stats = decp_stats.dropna()
-    choropleth = folium.Choropleth(
-        geo_data=geo_data,
-        topojson=topojson_key,
-        key_on=key_on,
-        data=decp_stats,
-        columns=[key_column, data_column],
-        fill_color="YlGn",  # "RdYlGn", #"YlGn",  #'YlOrRd',  #'YlGnBu',
-        fill_opacity=0.7,
-        line_weight=0,
-        nan_fill_color="black",  # "#800000",
-        nan_fill_opacity=0.3,
-        highlight=True,
-        legend_name=legend,
+    instrumentation.record_payload("html_carte", len(html.encode("utf-8")))
+    components.html(
+        html, height=conf.web.hauteur_carte + conf.web.hauteur_tableaux, width=700
     )
-    if tooltip_fields is not None:
-        choropleth.geojson.add_child(folium.features.GeoJsonTooltip(
-            fields=tooltip_fields,
-            aliases=tooltip_aliases,
-            #style=('background-color: white; color: black;')
-        ))
-    return choropleth
-
-
-def build_chloropleth_layer_for_cities(topo_cities, decp_stats, data_column, legend=None):
-    return chloropleth_layer(
-        "feature.properties.ID",
-        "code_commune_acheteur",
-        topo_cities,
-        data_column,
-        decp_stats,
-        topojson_key="objects.poly",
-        legend=legend,
-        tooltip_fields=["ID"],
-        tooltip_aliases=["Code commune"],
+
+
+def run_from_site(site_index: dict, selected_scale: str):
+    """Affiche la carte depuis le site pré-calculé (commande build-site).
+
+    Args:
+        site_index (dict): Index du site pré-calculé
+        selected_scale (str): Echelle sélectionnée
+    """
+    site_path = conf.site.chemin
+    zone_column = stats_module.SCALES[selected_scale]
+    display_update_date(datetime.strptime(site_index["date"], "%Y-%m-%dT%H:%M:%S"))
+    with instrumentation.step("chargement_site"):
+        page = load.load_site_page(site_path, zone_column)
+    display_map_html(page)
+
+
+def display_update_date(update_datetime: datetime):
+    """Affiche la date de mise à jour des données dans la barre latérale.
+
+    Args:
+        update_datetime (datetime): Date de mise à jour des données
+    """
+    st.sidebar.markdown(
+        f"*Données mises à jour le {update_datetime.strftime('%d/%m/%Y')}.*"
     )
 
 
-def build_chloropleth_layer_for_departments(topo_departements, decp_stats, data_column, legend=None):
-    return chloropleth_layer(
-        "feature.properties.code",
-        "code_departement_acheteur",
-        topo_departements,
-        data_column,
-        decp_stats,
-        legend=legend,
-        tooltip_fields=["nom", "code"],
-        tooltip_aliases=["Département", "Code département"],
+def get_map_html(
+    coverage_artifact_url: str,
+    compared_artifact_url: str,
+    selected_scale: str,
+    parent_scale: str,
+    parent_code: str,
+):
+    """Calcule le code HTML de la carte d'une échelle, pour toutes les années et tous les indicateurs.
+    Si une zone parente est sélectionnée, seules ses zones enfants sont représentées.
+    Si un artifact de comparaison est sélectionné, l'évolution depuis cet artifact est représentée.
+
+    Args:
+        coverage_artifact_url (str): URL de l'artifact de couverture
+        compared_artifact_url (str): URL de l'artifact de comparaison, ou None
+        selected_scale (str): Echelle sélectionnée
+        parent_scale (str): Echelle de la zone parente (Régions ou Départements), ou None
+        parent_code (str): Code de la zone parente, ou None
+
+    Returns:
+        str: Code HTML de la carte
+    """
+    stats_by_year = {
+        year: cached__get_year_stats(coverage_artifact_url, year)[selected_scale]
+        for year in conf.web.annees
+    }
+    zones_label = selected_scale.lower()
+    if parent_code is not None:
+        zone_indexes = cached__get_zone_indexes(coverage_artifact_url)
+        children = zone_indexes[parent_scale].get(parent_code, [])
+        with instrumentation.step("selection_zones"):
+            stats_by_year = {
+                year: stats_module.slice_zone_stats(stats, children)
+                for year, stats in stats_by_year.items()
+            }
+        topo = cached__load_children_contours(selected_scale, tuple(children))
+        parent_name = cached__get_zone_names(parent_scale).get(parent_code, parent_code)
+        zones_label += f" ({parent_name})"
+    elif selected_scale == "Communes":
+        topo = cached__load_cities()
+    elif selected_scale == "Départements":
+        topo = cached__load_departments()
+    elif selected_scale == "Régions":
+        topo = cached__load_regions()
+    if compared_artifact_url is not None:
+        with instrumentation.step("calcul_evolution"):
+            for year, stats in stats_by_year.items():
+                previous_stats = cached__get_year_stats(compared_artifact_url, year)[
+                    selected_scale
+                ]
+                if parent_code is not None:
+                    previous_stats = stats_module.slice_zone_stats(
+                        previous_stats, children
+                    )
+                stats_by_year[year] = stats_module.compute_zone_delta(
+                    stats, previous_stats
+                )
+
+    with instrumentation.step("construction_carte"):
+        folium_map = build_selector_map(
+            selected_scale,
+            topo,
+            stats_by_year,
+            zones_label,
+            fit_bounds=parent_code is not None,
+            delta=compared_artifact_url is not None,
+        )
+    with instrumentation.step("generation_html_carte"):
+        return folium.Figure().add_child(folium_map).render()
+
+
+def cached__get_map_html(
+    coverage_artifact_url: str,
+    compared_artifact_url: str,
+    selected_scale: str,
+    parent_scale: str,
+    parent_code: str,
+):
+    """Proxy de la fonction get_map_html avec cache LRU borné en mémoire"""
+    return snapshot_cache.get(
+        "cached__get_map_html",
+        (
+            coverage_artifact_url,
+            compared_artifact_url,
+            selected_scale,
+            parent_scale,
+            parent_code,
+        ),
+        get_map_html,
     )
 
 
-def build_chloropleth_layer_for_regions(topo_regions, decp_stats, data_column, legend=None):
-    return chloropleth_layer(
-        "feature.properties.code",
-        "code_region_acheteur",
-        topo_regions,
-        data_column,
-        decp_stats,
-        legend=legend,
-        tooltip_fields=["nom", "code"],
-        tooltip_aliases=["Région", "Code région"],
+def run_from_coverage(
+    coverage_artifact_url: str,
+    selected_scale: str,
+    parent_scale: str = None,
+    parent_code: str = None,
+    compared_artifact: tuple = None,
+):
+    """Calcule et affiche la carte depuis les statistiques de couverture.
+    Si une zone parente est sélectionnée, seules ses zones enfants sont affichées.
+    Si un instantané de comparaison est sélectionné, l'évolution depuis cet instantané est affichée.
+
+    Args:
+        coverage_artifact_url (str): URL de l'artifact de couverture
+        selected_scale (str): Echelle sélectionnée
+        parent_scale (str, optional): Echelle de la zone parente (Régions ou Départements). Defaults to None.
+        parent_code (str, optional): Code de la zone parente. Defaults to None.
+        compared_artifact (tuple, optional): Date et URL de l'artifact de comparaison. Defaults to None.
+    """
+    compared_artifact_url = None
+    if compared_artifact is not None:
+        compared_artifact_url = compared_artifact[1]
+        st.markdown(
+            f"La carte représente l'évolution depuis les données du {format_artifact_date(compared_artifact)}."
+        )
+    display_map_html(
+        cached__get_map_html(
+            coverage_artifact_url,
+            compared_artifact_url,
+            selected_scale,
+            parent_scale,
+            parent_code,
+        )
     )
 
 
-# @st.cache(ttl=86400)
-def init_map():
-    """Initialise une carte folium.
+def select_zone(label: str, codes: list, names: dict, none_label: str):
+    """Affiche dans la barre latérale une liste de sélection de zones.
+
+    Args:
+        label (str): Libellé de la liste
+        codes (list): Codes des zones proposées
+        names (dict): Nom de chaque zone par code de zone
+        none_label (str): Libellé de l'absence de sélection
 
     Returns:
-        folium.Map
+        str: Code de la zone sélectionnée, ou None
     """
-    return folium.Map(
-        location=[47, 2],
-        zoom_start=6,
-        tiles=conf.web.folium.tiles,
-        attr=conf.web.folium.attribution,
-        # crs=None #'EPSG4326' #'EPSG3857'
+    return st.sidebar.selectbox(
+        label,
+        [None] + list(codes),
+        format_func=lambda code: none_label
+        if code is None
+        else f"{names.get(code, code)} ({code})",
     )
 
 
+def format_artifact_date(artifact: tuple):
+    """Formate la date d'un artifact de couverture pour les listes de sélection."""
+    return artifact[0].strftime("%d/%m/%Y")
+
+
 def run():
 
+    if instrumentation.ENABLED:
+        instrumentation.start_run()
+
     st.set_page_config(
         page_title=conf.web.titre_page,
         page_icon="decp_couverture/static/favicon.ico",
@@ -211,148 +605,77 @@ def run():
     st.image("decp_couverture/static/logo.png", width=300)
     st.title(conf.web.titre_page)
 
-    st.sidebar.markdown(conf.web.texte_haut_barre_laterale)
-    selected_year = st.sidebar.selectbox("Année", conf.web.annees)
-    selected_scale = st.sidebar.selectbox(
-        "Echelle", ["Communes", "Départements", "Régions"], index=1
-    )
-    st.sidebar.markdown(conf.web.texte_bas_barre_laterale)
-
     cached__download_contours()
-    (
-        last_coverage_artifact_datetime,
-        last_coverage_artifact_url,
-    ) = cached__get_last_artifact("coverage.csv")
-    coverage = cached__get_coverage(last_coverage_artifact_url)
-
-    st.sidebar.markdown(
-        f"*Données mises à jour le {last_coverage_artifact_datetime.strftime('%d/%m/%Y')}.*"
-    )
-
-    selected_year_decp_stats = coverage[coverage.annee_marche == selected_year]
 
-    selected_year_decp_stats_cities = (
-        selected_year_decp_stats.groupby(["code_commune_acheteur"])
-        .agg(
-            nombre_marches=("nombre_marches", "sum"),
-            nombre_sirens_decp=("nombre_sirens_decp", "sum"),
-            nombre_sirens_insee=("nombre_sirens_insee", "sum"),
-        )
-        .reset_index()
-    )
-    selected_year_decp_stats_cities[
-        "sirens_couverts"
-    ] = selected_year_decp_stats_cities.nombre_sirens_decp.fillna(
-        1
-    ) / selected_year_decp_stats_cities.nombre_sirens_insee.fillna(
-        1
-    )
-    selected_year_decp_stats_cities["pourcentage_sirens_couverts"] = (
-        (selected_year_decp_stats_cities.sirens_couverts * 100).round(0).astype(int)
+    st.sidebar.markdown(conf.web.texte_haut_barre_laterale)
+    # Instantanés : un artifact de couverture par exécution du workflow
+    coverage_artifacts = cached__get_coverage_artifacts()
+    selected_artifact = st.sidebar.selectbox(
+        "Date des données", coverage_artifacts, format_func=format_artifact_date
     )
-    selected_year_decp_stats_cities["pourcentage_sirens_couverts"] = selected_year_decp_stats_cities["pourcentage_sirens_couverts"].clip(lower=0, upper=100)
-    del selected_year_decp_stats_cities["sirens_couverts"]
-    del selected_year_decp_stats_cities["nombre_sirens_decp"]
-    del selected_year_decp_stats_cities["nombre_sirens_insee"]
-    selected_year_decp_stats_departments = (
-        selected_year_decp_stats.groupby(["code_departement_acheteur"])
-        .agg(
-            nombre_marches=("nombre_marches", "sum"),
-            nombre_sirens_decp=("nombre_sirens_decp", "sum"),
-            nombre_sirens_insee=("nombre_sirens_insee", "sum"),
+    coverage_artifact_datetime, coverage_artifact_url = selected_artifact
+    older_artifacts = [
+        artifact for artifact in coverage_artifacts if artifact[0] < coverage_artifact_datetime
+    ]
+    compared_artifact = None
+    if len(older_artifacts) > 0:
+        compared_artifact = st.sidebar.selectbox(
+            "Comparer avec",
+            [None] + older_artifacts,
+            format_func=lambda artifact: "Aucune comparaison"
+            if artifact is None
+            else format_artifact_date(artifact),
         )
-        .reset_index()
-    )
-    selected_year_decp_stats_departments[
-        "sirens_couverts"
-    ] = selected_year_decp_stats_departments.nombre_sirens_decp.fillna(
-        1
-    ) / selected_year_decp_stats_departments.nombre_sirens_insee.fillna(
-        1
-    )
-    selected_year_decp_stats_departments["pourcentage_sirens_couverts"] = (
-        (selected_year_decp_stats_departments.sirens_couverts * 100)
-        .round(0)
-        .astype(int)
+    # Navigation par niveaux : régions, puis départements d'une région, puis communes d'un département
+    region_names = cached__get_zone_names("Régions")
+    selected_region = select_zone(
+        "Région", sorted(region_names), region_names, "Toutes"
     )
-    del selected_year_decp_stats_departments["sirens_couverts"]
-    del selected_year_decp_stats_departments["nombre_sirens_decp"]
-    del selected_year_decp_stats_departments["nombre_sirens_insee"]
-    selected_year_decp_stats_regions = (
-        selected_year_decp_stats.groupby(["code_region_acheteur"])
-        .agg(
-            nombre_marches=("nombre_marches", "sum"),
-            nombre_sirens_decp=("nombre_sirens_decp", "sum"),
-            nombre_sirens_insee=("nombre_sirens_insee", "sum"),
+    selected_department = None
+    if selected_region is None:
+        selected_scale = st.sidebar.selectbox(
+            "Echelle", list(stats_module.SCALES), index=1
         )
-        .reset_index()
-    )
-    selected_year_decp_stats_regions[
-        "sirens_couverts"
-    ] = selected_year_decp_stats_regions.nombre_sirens_decp.fillna(
-        1
-    ) / selected_year_decp_stats_regions.nombre_sirens_insee.fillna(
-        1
-    )
-    selected_year_decp_stats_regions["pourcentage_sirens_couverts"] = (
-        (selected_year_decp_stats_regions.sirens_couverts * 100).round(0).astype(int)
-    )
-    del selected_year_decp_stats_regions["sirens_couverts"]
-    del selected_year_decp_stats_regions["nombre_sirens_decp"]
-    del selected_year_decp_stats_regions["nombre_sirens_insee"]
-
-    options_dict = {
-        "Part des acheteurs publics représentés dans les DECP": "pourcentage_sirens_couverts",
-        "Nombre de marchés recensés dans les DECP": "nombre_marches",
-    }
-    selected_option = st.radio("Indicateur à représenter:", options_dict.keys())
-    selected_column = options_dict[selected_option]
-
-    if selected_scale == "Communes":
-        topo = load.load_cities()
-        stats = selected_year_decp_stats_cities
-        chloropleth_layer = build_chloropleth_layer_for_cities(
-            topo, stats, selected_column, legend=selected_option
-        )
-        # chloropleth_layer = build_chloropleth_layer("objects.a_com2021_2154.geometries", "properties.codgeo", "codeCommuneAcheteur", topo, stats)
-    elif selected_scale == "Départements":
-        topo = load.load_departments()
-        stats = selected_year_decp_stats_departments
-        chloropleth_layer = build_chloropleth_layer_for_departments(
-            topo, stats, selected_column, legend=selected_option
-        )
-        # chloropleth_layer = build_chloropleth_layer("objects.a_dep2021_2154.geometries", "properties.dep", "departementAcheteur", topo, stats)
-    elif selected_scale == "Régions":
-        topo = load.load_regions()
-        stats = selected_year_decp_stats_regions
-        chloropleth_layer = build_chloropleth_layer_for_regions(
-            topo, stats, selected_column, legend=selected_option
+    else:
+        zone_indexes = cached__get_zone_indexes(coverage_artifact_url)
+        selected_department = select_zone(
+            "Département",
+            zone_indexes["Régions"].get(selected_region, []),
+            cached__get_zone_names("Départements"),
+            "Tous",
         )
-        # chloropleth_layer = build_chloropleth_layer("objects.a_reg2021_2154.geometries", "properties.reg", "codeRegionAcheteur", topo, stats)
+        selected_scale = "Départements" if selected_department is None else "Communes"
+    st.sidebar.markdown(conf.web.texte_bas_barre_laterale)
 
-    st.markdown(
-        f"{len(stats)} {selected_scale.lower()} ont des marchés représentés dans les DECP au cours de l'année {selected_year}."
+    # Le site pré-calculé ne contient que la vue nationale des dernières données
+    use_site = (
+        conf.web.utiliser_site_precalcule
+        and selected_region is None
+        and selected_artifact == coverage_artifacts[0]
+        and compared_artifact is None
     )
-
-    folium_map = init_map()
-
-    added_layer = chloropleth_layer.add_to(folium_map)
-    # folium_map.fit_bounds(added_layer.get_bounds())
-    folium_static(folium_map)
-
-    col1, col2 = st.columns([2,3])
-    col1.markdown(f"**{selected_scale} avec le plus de marchés:**")
-    markdown_col1 = f"| Code | Nombre de marchés | \n | ------------- |:-------------:|"
-    zones_most_markets = stats.sort_values(by="nombre_marches", ascending=False).head(5)
-    for zone, num_markets, _ in zones_most_markets.values.tolist():
-        markdown_col1 += f"\n | {zone} | {num_markets} marchés |"
-    col1.markdown(markdown_col1)
-    col2.markdown(f"**{selected_scale} avec le plus d'acheteurs publics représentés:**")
-    zones_most_sirens = stats.sort_values(by="pourcentage_sirens_couverts", ascending=False).head(5)
-    markdown_col2 = f"| Code | Acheteurs publics représentés | \n | ------------- |:-------------:|"
-    for zone, _, covered_percentage in zones_most_sirens.values.tolist():
-        markdown_col2 += f"\n | {zone} | {covered_percentage}% |"
-    col2.markdown(markdown_col2)
+    site_index = cached__get_site() if use_site else None
+    # Un site pré-calculé au format précédent (une carte par année et par indicateur) est ignoré
+    if site_index is not None and site_index.get("format") == "selecteur":
+        run_from_site(site_index, selected_scale)
+    else:
+        display_update_date(coverage_artifact_datetime)
+        if selected_department is not None:
+            parent_scale, parent_code = "Départements", selected_department
+        elif selected_region is not None:
+            parent_scale, parent_code = "Régions", selected_region
+        else:
+            parent_scale, parent_code = None, None
+        run_from_coverage(
+            coverage_artifact_url,
+            selected_scale,
+            parent_scale=parent_scale,
+            parent_code=parent_code,
+            compared_artifact=compared_artifact,
+        )
 
     st.markdown("\n")
-    st.markdown("*Le nombre d'acheteurs publics correspond au nombre d'entités référencées dans le répertoire Sirene, mis à disposition par l'[INSEE](https://www.insee.fr/fr/information/3591226) et disponible sur [data.gouv.fr](https://www.data.gouv.fr/fr/datasets/base-sirene-des-entreprises-et-de-leurs-etablissements-siren-siret/), dont le code SIREN débute par [le chiffre 1 ou 2](https://www.insee.fr/fr/metadonnees/definition/c2047).*")
\ No newline at end of file
+    st.markdown("*Le nombre d'acheteurs publics correspond au nombre d'entités référencées dans le répertoire Sirene, mis à disposition par l'[INSEE](https://www.insee.fr/fr/information/3591226) et disponible sur [data.gouv.fr](https://www.data.gouv.fr/fr/datasets/base-sirene-des-entreprises-et-de-leurs-etablissements-siren-siret/), dont le code SIREN débute par [le chiffre 1 ou 2](https://www.insee.fr/fr/metadonnees/definition/c2047). Le nombre d'établissements publics correspond au nombre de SIRETs de ces entités.*")
+
+    if instrumentation.ENABLED:
+        instrumentation.display_report(instrumentation.end_run())
\ No newline at end of file
@@ -4,4 +4,5 @@ l'application Web depuis la racine du projet avec le CLI Streamlit (streamlit ru
 
 from decp_couverture import web
 
+web.start_warmup()
 web.run()